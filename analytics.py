@@ -0,0 +1,293 @@
+import math
+
+import numpy as np
+
+
+def _column(window, field, default=0.0):
+    # Zero-copy view of the window's float array, missing days filled with default
+    values = np.frombuffer(window.columns[field], dtype=np.float64)
+    return np.where(np.isnan(values), default, values)
+
+
+def _matrix(windows, field, default=0.0):
+    # Stack several athletes' windows into one (athletes x days) matrix.
+    # Shorter windows are padded with NaN so nan-aware reductions skip them.
+    width = max((len(w) for w in windows), default=0)
+    matrix = np.full((len(windows), width), np.nan)
+    for row, window in enumerate(windows):
+        if len(window):
+            matrix[row, :len(window)] = _column(window, field, default)
+    return matrix
+
+
+def _row_mean(matrix, counts):
+    return np.divide(np.nansum(matrix, axis=1), counts, out=np.zeros(len(counts)), where=counts > 0)
+
+
+def rolling_mean(values, width):
+    # Trailing mean over each full run of `width` consecutive records
+    if len(values) < width:
+        return np.empty(0)
+    cumsum = np.cumsum(np.insert(values, 0, 0.0))
+    return (cumsum[width:] - cumsum[:-width]) / width
+
+
+def window_means(window, defaults):
+    # Mean of each field over the window (0 for an empty window)
+    if not len(window):
+        return {field: 0.0 for field in defaults}
+    return {field: float(_column(window, field, default).mean()) for field, default in defaults.items()}
+
+
+def _analytics_payload(avg_sleep, avg_mood, training_consistency, homework_completion, avg_hydration):
+    # Predictability Index (0-100)
+    sleep_score = min(100, (avg_sleep / 9.0) * 100)  # Target: 9 hours
+    nutrition_score = min(100, (avg_hydration / 8.0) * 100)  # Target: 8 bottles
+    recovery_score = min(100, (avg_mood / 5.0) * 100)  # Target: 5/5 mood
+    training_score = training_consistency
+    mental_score = min(100, (avg_mood / 5.0) * 100)
+
+    predictability_index = (
+        sleep_score * 0.25 +
+        nutrition_score * 0.25 +
+        recovery_score * 0.20 +
+        training_score * 0.15 +
+        mental_score * 0.15
+    )
+
+    # Status color coding
+    if predictability_index >= 80: status = '🟢 Optimal'
+    elif predictability_index >= 60: status = '🟡 Moderate'
+    else: status = '🔴 Overload'
+
+    # AI Alerts
+    alerts = []
+    if avg_sleep < 8: alerts.append('⚠️ Sleep below target - injury risk increased')
+    if avg_hydration < 6: alerts.append('💧 Hydration low - performance may suffer')
+    if training_consistency > 85 and avg_sleep < 8: alerts.append('🚨 High training + low sleep = overload risk')
+    if avg_mood < 3: alerts.append('😟 Mood trending low - consider rest day')
+
+    return {
+        'predictability_index': round(predictability_index, 1),
+        'status': status,
+        'avg_sleep': avg_sleep,
+        'avg_mood': avg_mood,
+        'training_consistency': training_consistency,
+        'homework_completion': homework_completion,
+        'avg_hydration': avg_hydration,
+        'alerts': alerts,
+        'scores': {
+            'sleep': round(sleep_score, 1),
+            'nutrition': round(nutrition_score, 1),
+            'recovery': round(recovery_score, 1),
+            'training': round(training_score, 1),
+            'mental': round(mental_score, 1)
+        }
+    }
+
+
+def analytics_batch(windows):
+    # Core metrics for many athletes in one pass
+    counts = np.array([len(w) for w in windows], dtype=np.float64)
+    avg_sleep = _row_mean(_matrix(windows, 'sleep_hours'), counts)
+    avg_mood = _row_mean(_matrix(windows, 'mood'), counts)
+    training_consistency = _row_mean(_matrix(windows, 'training_completed'), counts) * 100
+    homework_completion = _row_mean(_matrix(windows, 'homework_done'), counts) * 100
+    avg_hydration = _row_mean(_matrix(windows, 'water_bottles'), counts)
+
+    return [
+        _analytics_payload(float(avg_sleep[i]), float(avg_mood[i]), float(training_consistency[i]),
+                           float(homework_completion[i]), float(avg_hydration[i]))
+        if count else {'predictability_index': 0, 'status': 'No data'}
+        for i, count in enumerate(counts)
+    ]
+
+
+def _recovery_payload(avg_sleep, avg_mood, training_load):
+    # Recovery recommendations
+    recommendations = []
+    if avg_sleep < 8:
+        recommendations.append({'type': 'sleep', 'priority': 'high', 'action': 'Increase sleep by 30-60 minutes'})
+    if avg_mood < 3.5:
+        recommendations.append({'type': 'mental', 'priority': 'medium', 'action': 'Add meditation or relaxation time'})
+    if training_load > 5:
+        recommendations.append({'type': 'training', 'priority': 'high', 'action': 'Schedule active recovery day'})
+
+    recovery_score = min(100, (avg_sleep / 9 * 40) + (avg_mood / 5 * 35) + ((7 - training_load) / 7 * 25))
+
+    return {
+        'recovery_score': round(recovery_score, 1),
+        'sleep_quality': round(avg_sleep, 1),
+        'mental_state': round(avg_mood, 1),
+        'training_load': training_load,
+        'recommendations': recommendations,
+        'next_action': recommendations[0]['action'] if recommendations else 'Maintain current routine'
+    }
+
+
+def recovery_batch(windows):
+    counts = np.array([len(w) for w in windows], dtype=np.float64)
+    avg_sleep = _row_mean(_matrix(windows, 'sleep_hours'), counts)
+    avg_mood = _row_mean(_matrix(windows, 'mood'), counts)
+    training_load = np.nansum(_matrix(windows, 'training_completed'), axis=1)
+
+    return [
+        _recovery_payload(float(avg_sleep[i]), float(avg_mood[i]), int(training_load[i]))
+        if count else {'status': 'no_data'}
+        for i, count in enumerate(counts)
+    ]
+
+
+def injury_risk_batch(windows):
+    counts = np.array([len(w) for w in windows], dtype=np.float64)
+    # Comparisons against NaN padding are False, so padded days never count
+    sleep_risk = _row_mean(_matrix(windows, 'sleep_hours', 8) < 7, counts)
+    training_load = _row_mean(_matrix(windows, 'training_completed') > 0, counts)
+    mood_risk = _row_mean(_matrix(windows, 'mood', 3) < 3, counts)
+
+    # Calculate risk score (0-100)
+    risk_score = (sleep_risk * 40) + (training_load * 30) + (mood_risk * 30)
+
+    results = []
+    for i, count in enumerate(counts):
+        if count < 3:
+            results.append({'risk_level': 'unknown', 'score': 0})
+            continue
+
+        score = float(risk_score[i])
+        if score > 60: risk_level = 'high'
+        elif score > 30: risk_level = 'moderate'
+        else: risk_level = 'low'
+
+        results.append({
+            'risk_level': risk_level,
+            'score': round(score, 1),
+            'factors': {
+                'sleep_issues': round(float(sleep_risk[i]) * 100, 1),
+                'training_load': round(float(training_load[i]) * 100, 1),
+                'mood_concerns': round(float(mood_risk[i]) * 100, 1)
+            }
+        })
+    return results
+
+
+def injury_risk_summary(window):
+    return injury_risk_batch([window])[0]
+
+
+def _sleep_payload(avg_sleep, sleep_range, sleep_std, good_sleep_days, good_sleep_mood, sleep_mood_r):
+    # Sleep quality analysis
+    sleep_consistency = 1 - sleep_range / 12  # 0-1 scale
+
+    # Sleep-mood correlation
+    avg_mood_good_sleep = good_sleep_mood / max(good_sleep_days, 1)
+
+    return {
+        'average_sleep': round(avg_sleep, 1),
+        'consistency_score': round(sleep_consistency * 100, 1),
+        'sleep_variability': round(sleep_std, 2),
+        'optimal_sleep_days': good_sleep_days,
+        'mood_correlation': round(avg_mood_good_sleep, 1),
+        'sleep_mood_r': round(sleep_mood_r, 2),
+        'recommendations': [
+            'Target 9 hours nightly' if avg_sleep < 8.5 else 'Excellent sleep duration',
+            'Improve consistency' if sleep_consistency < 0.8 else 'Great sleep routine'
+        ]
+    }
+
+
+def trend_summary(window):
+    if len(window) < 7:
+        return {'status': 'insufficient_data'}
+
+    columns = {
+        'avg_sleep': _column(window, 'sleep_hours'),
+        'avg_mood': _column(window, 'mood'),
+        'training_rate': _column(window, 'training_completed') * 100,
+        'hydration': _column(window, 'water_bottles')
+    }
+
+    def week_stats(lo, hi):
+        # An exactly-one-week history leaves week2 empty; count it as zeros
+        n = max(hi - lo, 1)
+        return {name: float(values[lo:hi].sum()) / n for name, values in columns.items()}
+
+    # Split into two weeks
+    w1_stats = week_stats(0, 7)
+    w2_stats = week_stats(7, len(window))
+
+    trends = {
+        'sleep_trend': 'improving' if w2_stats['avg_sleep'] > w1_stats['avg_sleep'] else 'declining',
+        'mood_trend': 'improving' if w2_stats['avg_mood'] > w1_stats['avg_mood'] else 'declining',
+        'training_trend': 'improving' if w2_stats['training_rate'] > w1_stats['training_rate'] else 'declining',
+        'hydration_trend': 'improving' if w2_stats['hydration'] > w1_stats['hydration'] else 'declining'
+    }
+
+    return {
+        'week1': w1_stats,
+        'week2': w2_stats,
+        'trends': trends,
+        'rolling_sleep_avg': [round(float(v), 2) for v in rolling_mean(columns['avg_sleep'], 7)],
+        'overall_direction': 'positive' if sum(1 for t in trends.values() if t == 'improving') >= 3 else 'needs_attention'
+    }
+
+
+def _activity_payload(days_tracked, avg_steps, avg_active_minutes, avg_calories, step_goal_met, activity_goal_met):
+    return {
+        'avg_steps': round(avg_steps),
+        'avg_active_minutes': round(avg_active_minutes),
+        'avg_calories': round(avg_calories),
+        'days_tracked': days_tracked,
+        'step_goal_met': step_goal_met,
+        'activity_goal_met': activity_goal_met
+    }
+
+
+# The same payloads read in O(1) from a materialised rollup window
+# (count, sum, sumsq, min, max per field; see rollups.py)
+def _agg_mean(agg, field):
+    return agg['sum'][field] / agg['count']
+
+
+def _agg_std(agg, field):
+    mean = _agg_mean(agg, field)
+    return math.sqrt(max(agg['sumsq'][field] / agg['count'] - mean * mean, 0.0))
+
+
+def analytics_from_rollup(agg):
+    if not agg['count']:
+        return {'predictability_index': 0, 'status': 'No data'}
+    return _analytics_payload(_agg_mean(agg, 'sleep_hours'), _agg_mean(agg, 'mood'),
+                              _agg_mean(agg, 'training_completed') * 100,
+                              _agg_mean(agg, 'homework_done') * 100, _agg_mean(agg, 'water_bottles'))
+
+
+def recovery_from_rollup(agg):
+    if not agg['count']:
+        return {'status': 'no_data'}
+    return _recovery_payload(_agg_mean(agg, 'sleep_hours'), _agg_mean(agg, 'mood'),
+                             int(round(agg['sum']['training_completed'])))
+
+
+def sleep_from_rollup(agg):
+    if not agg['count']:
+        return {'status': 'no_data'}
+    sleep_std = _agg_std(agg, 'sleep_hours')
+    mood_std = _agg_std(agg, 'mood')
+    sleep_mood_r = 0.0
+    # Tiny spreads are floating-point residue from incremental updates
+    if agg['count'] > 1 and sleep_std > 1e-9 and mood_std > 1e-9:
+        covariance = (agg['sum']['sleep_x_mood'] / agg['count']
+                      - _agg_mean(agg, 'sleep_hours') * _agg_mean(agg, 'mood'))
+        sleep_mood_r = max(-1.0, min(1.0, covariance / (sleep_std * mood_std)))
+    return _sleep_payload(_agg_mean(agg, 'sleep_hours'), agg['max']['sleep_hours'] - agg['min']['sleep_hours'],
+                          sleep_std, int(round(agg['sum']['good_sleep'])), agg['sum']['good_sleep_mood'],
+                          sleep_mood_r)
+
+
+def activity_from_rollup(agg):
+    if not agg['count']:
+        return {'status': 'no_data'}
+    return _activity_payload(agg['count'], _agg_mean(agg, 'steps'), _agg_mean(agg, 'active_minutes'),
+                             _agg_mean(agg, 'calories'), int(round(agg['sum']['step_goal'])),
+                             int(round(agg['sum']['activity_goal'])))
@@ -1,23 +1,56 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, send_from_directory
+from flask import Flask, render_template, request, jsonify, session, redirect, g
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_talisman import Talisman
-from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, date
-import json
 import os
+import base64
+import glob
+import hashlib
 import secrets
-import bleach
+import time
+import calendar
+import csv
+import json
 import uuid
 from functools import wraps
+from storage import JSONStorage, create_storage, migrate, page_items
+from jsoncodec import FastJSONProvider
+import jsoncodec
+from compression import compress_response
+from assets import StaticAssets, build_assets
+from pages import RenderCache, compile_templates
+from timeseries import SERIES_FIELDS, SeriesCache, TimeSeries
+from competitions import CalendarCache
+from analytics import (activity_from_rollup, analytics_batch, analytics_from_rollup, injury_risk_batch,
+                       injury_risk_summary, recovery_batch, recovery_from_rollup, sleep_from_rollup, trend_summary,
+                       window_means)
+from rollups import ROLLUP_FIELDS, Rollup
+from validation import Field, Schema, clean_text, validate_json
+from sessions import create_session_interface
+from passwords import HasherBusy, PasswordHasher
+from metrics import Metrics
+import limiter_storage  # also registers the sqlite:// rate-limit storage scheme
 
-app = Flask(__name__)
+app = Flask(__name__, static_folder=None)
 app.secret_key = os.environ.get('SECRET_KEY', secrets.token_hex(32))
+# Compact JSON responses, through orjson when it is installed
+app.json = FastJSONProvider(app)
+
+# Static files route: fingerprinted URLs (see static_url) are cached for a year
+STATIC_DIR = os.path.join(app.root_path, 'static')
+static_assets = StaticAssets(STATIC_DIR)
+app.jinja_env.globals['static_url'] = static_assets.url
 
-# Static files route
 @app.route('/static/<path:filename>')
 def static_files(filename):
-    return send_from_directory('static', filename)
+    return static_assets.send(filename)
+
+# Timing starts here, ahead of the rate limiter's hook, so rejected requests
+# are timed too (see record_request_metrics)
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
 
 @app.route('/favicon.ico')
 def favicon():
@@ -25,7 +58,12 @@ def favicon():
 
 @app.route('/health')
 def health_check():
-    return jsonify({'status': 'healthy', 'message': 'PAMS is running'}), 200
+    health = {'status': 'healthy', 'message': 'PAMS is running'}
+    cache_stats = storage.cache_stats()
+    if cache_stats is not None:
+        health['cache'] = cache_stats
+    health['page_cache'] = page_cache.stats()
+    return jsonify(health), 200
 
 # Security middleware with relaxed CSP for inline styles
 Talisman(app, 
@@ -37,20 +75,32 @@ Talisman(app,
         'img-src': "'self' data:"
     }
 )
+
+# gzip (or brotli, when installed) for JSON and HTML bodies the client accepts
+app.after_request(compress_response)
+
+# Rate limits are counted in a SQLite file shared by every worker on the host,
+# over a moving window. PAMS_RATELIMIT_STORAGE takes any limits storage URI
+# (memory:// for per-process counters, redis://... for several hosts).
+RATELIMIT_STORAGE = os.environ.get(
+    'PAMS_RATELIMIT_STORAGE', limiter_storage.storage_uri(os.environ.get('PAMS_DATA_DIR', 'data')))
 limiter = Limiter(
     key_func=get_remote_address,
     app=app,
-    default_limits=["200 per day", "50 per hour"]
+    default_limits=["200 per day", "50 per hour"],
+    storage_uri=RATELIMIT_STORAGE,
+    strategy='moving-window'
 )
 
 # Input sanitization
 def sanitize_input(data):
+    # Routes with a Schema get text cleaned during validation instead
     if isinstance(data, dict):
         return {k: sanitize_input(v) for k, v in data.items()}
     elif isinstance(data, list):
         return [sanitize_input(item) for item in data]
     elif isinstance(data, str):
-        return bleach.clean(data, tags=[], strip=True)
+        return clean_text(data)
     return data
 
 # Authentication decorator
@@ -62,94 +112,342 @@ def require_auth(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# Conditional GET: the ETag is built from the versions of the collections a
+# response is computed from, so an unchanged poll gets a 304 before the
+# handler runs. RELEASE changes whenever the code or templates do.
+def release_hash():
+    digest = hashlib.sha1()
+    for pattern in ('*.py', os.path.join('templates', '*.html')):
+        for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), pattern))):
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+RELEASE = release_hash()
+
+def conditional_get(collections, per_user=True, cache_control='private, no-cache'):
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method != 'GET':
+                return f(*args, **kwargs)
+            
+            user_id = session.get('user_id')
+            versions = [storage.user_version(c, user_id) if per_user else storage.collection_version(c)
+                        for c in collections]
+            etag = hashlib.sha1(repr((RELEASE, request.full_path, user_id, versions)).encode()).hexdigest()
+            if request.if_none_match.contains_weak(etag):
+                response = app.response_class(status=304)
+            else:
+                response = app.make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = cache_control
+            response.vary.add('Cookie')
+            return response
+        return decorated_function
+    return decorator
+
+# Rendered pages are kept per worker under key plus RELEASE; callers put the
+# storage versions of whatever the page shows in the key. Repeat visits get a
+# 304 from the page's ETag. Debug mode reloads templates, so it skips the cache.
+def cached_page(key, render, cache_control='private, no-cache'):
+    if app.debug:
+        html = render()
+        etag = hashlib.sha1(html.encode('utf-8')).hexdigest()
+    else:
+        html, etag = page_cache.get((RELEASE,) + key, render)
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(html, mimetype='text/html')
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = cache_control
+    response.vary.add('Cookie')
+    return response
+
+def shared_page(template_name, cache_control='public, no-cache'):
+    # Templates with no per-user content: one rendering serves everyone
+    return cached_page((template_name,), lambda: render_template(template_name), cache_control)
+
 # User management functions
 def get_current_user():
+    # Loaded once per request and shared by the route and the data helpers
     if 'user_id' not in session:
         return None
-    users = load_data('users')
-    return users.get(session['user_id'])
+    cached = g.get('current_user')
+    if cached is None or cached[0] != session['user_id']:
+        g.current_user = (session['user_id'], storage.load_user('users', session['user_id']) or None)
+    return g.current_user[1]
 
-def get_user_data(filename, user_id=None):
+def start_session(user):
+    # Role and family travel with the session so authorization checks
+    # don't need to read the users collection
+    session.clear()
+    if hasattr(session, 'regenerate'):
+        session.regenerate()
+    session['user_id'] = user['id']
+    session['role'] = user['role']
+    session['family_id'] = user.get('family_id')
+    g.current_user = (user['id'], user)
+
+def current_role():
+    if 'user_id' not in session:
+        return None
+    if 'role' not in session:
+        # Sessions started before roles were stored get them filled in once
+        user = get_current_user()
+        if not user:
+            return None
+        session['role'] = user['role']
+        session['family_id'] = user.get('family_id')
+    return session['role']
+
+def current_family():
+    # Family-shared data is keyed by family id; a user without a family
+    # (legacy accounts) gets a calendar of their own
+    if current_role() is None:
+        return None
+    return session.get('family_id') or session['user_id']
+
+def get_user_record(filename, key, user_id=None):
     if not user_id:
         user = get_current_user()
         if not user:
             return {}
         user_id = user['id']
     
-    data = load_data(filename)
-    return data.get(user_id, {})
+    return storage.load_record(filename, user_id, key)
 
-def save_user_data(filename, data, user_id=None):
+# Cursor pagination: ?limit=N&cursor=... where the cursor is the opaque sort
+# key of the oldest record on the previous page
+MAX_PAGE_SIZE = 100
+
+def encode_cursor(sort_key):
+    return base64.urlsafe_b64encode(json.dumps(list(sort_key)).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        sort_key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        raise ValueError('Invalid cursor')
+    if not (isinstance(sort_key, list) and len(sort_key) == 2 and all(isinstance(v, str) for v in sort_key)):
+        raise ValueError('Invalid cursor')
+    return tuple(sort_key)
+
+def page_params(default_limit):
+    limit = min(max(request.args.get('limit', default_limit, type=int), 1), MAX_PAGE_SIZE)
+    cursor = request.args.get('cursor')
+    return limit, decode_cursor(cursor) if cursor else None
+
+def finish_page(rows, limit):
+    # rows: newest-first (sort key, record), one more than limit if there's an older page.
+    # Records come back oldest first, like the unpaginated lists did.
+    next_cursor = encode_cursor(rows[limit - 1][0]) if len(rows) > limit else None
+    return [(sort_key[1], record) for sort_key, record in reversed(rows[:limit])], next_cursor
+
+def get_user_page(filename, default_limit, order_field=None, user_id=None):
+    # One page of a user's records as [(key, record)], plus the next cursor;
+    # raises ValueError for a malformed cursor
+    limit, before = page_params(default_limit)
     if not user_id:
         user = get_current_user()
         if not user:
-            return
+            return [], None
         user_id = user['id']
     
-    all_data = load_data(filename)
-    all_data[user_id] = data
-    save_data(filename, all_data)
+    return finish_page(storage.load_page(filename, user_id, limit + 1, before, order_field), limit)
 
-# Data storage (simple JSON files)
-DATA_DIR = 'data'
-os.makedirs(DATA_DIR, exist_ok=True)
+def get_user_series(filename, user_id=None):
+    # Date-sorted numeric columns for one user, cached until their data changes
+    if not user_id:
+        user = get_current_user()
+        if not user:
+            return TimeSeries({}, SERIES_FIELDS[filename])
+        user_id = user['id']
+    
+    return series_cache.get(storage, filename, user_id)
 
-def load_data(filename):
-    # Validate filename to prevent path traversal
-    if not filename.replace('_', '').replace('-', '').isalnum():
-        raise ValueError("Invalid filename")
+def save_user_record(filename, key, record, user_id=None):
+    # Write a single dated record without rewriting the user's other records
+    if not user_id:
+        user = get_current_user()
+        if not user:
+            return
+        user_id = user['id']
     
-    # Sanitize filename
-    filename = os.path.basename(filename)
-    path = os.path.join(DATA_DIR, f'{filename}.json')
+    if filename not in ROLLUP_FIELDS:
+        storage.put_record(filename, user_id, key, record)
+        return
+    # Record and rollup are written under one lock, so concurrent writes reach
+    # the rollup in the same order as the stored records
+    with storage.lock('rollups', user_id):
+        storage.put_record(filename, user_id, key, record)
+        update_rollup(filename, user_id, key, record)
+
+def save_user_records(filename, records, user_id=None):
+    # Batched save_user_record: one write for many dated records
+    if not user_id:
+        user = get_current_user()
+        if not user:
+            return
+        user_id = user['id']
     
-    # Ensure path is within DATA_DIR
-    real_data_dir = os.path.realpath(DATA_DIR)
-    real_path = os.path.realpath(path)
-    if not real_path.startswith(real_data_dir):
-        raise ValueError("Path traversal attempt detected")
+    if filename not in ROLLUP_FIELDS:
+        storage.put_records(filename, user_id, records)
+        return
+    with storage.lock('rollups', user_id):
+        storage.put_records(filename, user_id, records)
+        rebuild_rollup(filename, user_id)
+
+def update_rollup(filename, user_id, key, record):
+    # Fold one written record into the user's materialised rolling aggregates
+    with storage.lock('rollups', user_id):
+        state = storage.load_record('rollups', user_id, filename)
+        if state:
+            rollup = Rollup(filename, state)
+            rollup.apply(key, record)
+        else:
+            rollup = Rollup.build(filename, storage.load_user(filename, user_id))
+        storage.put_record('rollups', user_id, filename, rollup.to_dict())
+
+def rebuild_rollup(filename, user_id):
+    # For writes that bypass save_user_record, e.g. whole-history rewrites
+    with storage.lock('rollups', user_id):
+        rollup = Rollup.build(filename, storage.load_user(filename, user_id))
+        storage.put_record('rollups', user_id, filename, rollup.to_dict())
+    return rollup
+
+def get_user_rollup(filename, user_id=None):
+    if not user_id:
+        user = get_current_user()
+        if not user:
+            return Rollup(filename)
+        user_id = user['id']
     
-    try:
-        if os.path.exists(path):
-            with open(path, 'r') as f:
-                return json.load(f)
-        return {}
-    except (IOError, OSError, json.JSONDecodeError) as e:
-        return {}
+    state = storage.load_record('rollups', user_id, filename)
+    if not state:
+        # Users from before rollups existed get theirs built on first read
+        return rebuild_rollup(filename, user_id)
+    return Rollup(filename, state)
+
+# Data storage (JSON files by default, SQLite with PAMS_STORAGE=sqlite)
+DATA_DIR = os.environ.get('PAMS_DATA_DIR', 'data')
+os.makedirs(DATA_DIR, exist_ok=True)
+storage = create_storage(os.environ.get('PAMS_STORAGE', 'json'), DATA_DIR,
+                         os.environ.get('PAMS_SQLITE_PATH'))
+storage.recover()
+series_cache = SeriesCache()
+calendar_cache = CalendarCache()
+page_cache = RenderCache()
+compile_templates(app.jinja_env)
+
+# Request, storage and cache metrics, summed over every worker on the host in
+# a SQLite file and served at /metrics in Prometheus text format
+metrics = Metrics(os.environ.get('PAMS_METRICS_DB', os.path.join(DATA_DIR, 'metrics.db')))
+storage.observer = metrics
+metrics.track_cache('storage', storage.cache_stats)
+metrics.track_cache('pages', page_cache.stats)
+METRICS_TOKEN = os.environ.get('PAMS_METRICS_TOKEN')
+HTTP_METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS')
+
+@app.after_request
+def record_request_metrics(response):
+    # Labelled by route pattern, not path, so ids in URLs don't each make a series
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    method = request.method if request.method in HTTP_METHODS else 'other'
+    metrics.inc('pams_http_requests_total', route=route, method=method, status=response.status_code)
+    started = g.get('request_started')
+    if started is not None:
+        metrics.observe('pams_http_request_duration_seconds', time.perf_counter() - started,
+                        route=route, method=method)
+    if response.status_code == 429:
+        metrics.inc('pams_ratelimit_rejections_total', route=route)
+    return response
+
+@app.route('/metrics')
+@limiter.exempt
+def metrics_endpoint():
+    # Route names and traffic volumes aren't public: scrapers send
+    # PAMS_METRICS_TOKEN as a bearer token, and without one the endpoint is off
+    if not METRICS_TOKEN:
+        return jsonify({'error': 'Not found'}), 404
+    if not secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {METRICS_TOKEN}'):
+        return jsonify({'error': 'Authentication required'}), 401
+    response = app.response_class(metrics.render(), mimetype='text/plain')
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    response.cache_control.no_store = True
+    return response
+
+# Optional server-side sessions (PAMS_SESSION_STORE=sqlite|filesystem); by
+# default Flask keeps the session in a signed cookie
+SESSION_STORE = os.environ.get('PAMS_SESSION_STORE')
+if SESSION_STORE:
+    app.session_interface = create_session_interface(SESSION_STORE, os.environ.get(
+        'PAMS_SESSION_PATH', os.path.join(DATA_DIR, 'sessions.db' if SESSION_STORE == 'sqlite' else 'sessions')))
+
+def load_data(filename):
+    return storage.load(filename)
 
 def save_data(filename, data):
-    # Validate filename to prevent path traversal
-    if not filename.replace('_', '').replace('-', '').isalnum():
-        raise ValueError("Invalid filename")
-    
-    # Sanitize filename further
-    filename = os.path.basename(filename)
-    path = os.path.join(DATA_DIR, f'{filename}.json')
-    
-    # Ensure path is within DATA_DIR
-    real_data_dir = os.path.realpath(DATA_DIR)
-    real_path = os.path.realpath(path)
-    if not real_path.startswith(real_data_dir):
-        raise ValueError("Path traversal attempt detected")
-    
-    try:
-        with open(path, 'w') as f:
-            json.dump(data, f, indent=2)
-    except (IOError, OSError) as e:
-        raise ValueError(f"Failed to save data: {str(e)}")
+    storage.save(filename, data)
+
+@app.cli.command('migrate-storage')
+def migrate_storage_command():
+    # One-shot import of the data/ JSON files into the SQLite backend
+    target = create_storage('sqlite', DATA_DIR, os.environ.get('PAMS_SQLITE_PATH'))
+    migrated = migrate(JSONStorage(DATA_DIR), target)
+    for collection, count in migrated.items():
+        print(f'{collection}: {count} entries')
+    print(f'Migrated {len(migrated)} collections to {target.db_path}')
+
+@app.cli.command('reshard-storage')
+def reshard_storage_command():
+    # Split data/<collection>.json files into per-family shards; run with the app stopped
+    resharded = JSONStorage(DATA_DIR).reshard()
+    for collection, (entries, shards) in resharded.items():
+        print(f'{collection}: {entries} entries in {shards} shards')
+    print(f'Resharded {len(resharded)} collections in {DATA_DIR}')
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    # Minified, fingerprinted copies of static/*.css and *.js in static/dist
+    manifest = build_assets(STATIC_DIR)
+    for source, built in manifest.items():
+        print(f'{source} -> {built}')
 
 @app.route('/')
 def home():
     if 'user_id' in session:
-        user = get_current_user()
-        if user['role'] == 'parent':
+        if current_role() == 'parent':
             return redirect('/parent')
         else:
             return redirect('/athlete/dashboard')
-    response = app.make_response(render_template('auth.html'))
-    response.headers['Content-Type'] = 'text/html; charset=utf-8'
+    return shared_page('auth.html')
+
+# Password hashes are computed in a small process pool per worker
+# (PAMS_HASH_WORKERS, 0 = inline); once PAMS_HASH_QUEUE are pending, logins
+# are turned away with a 503 rather than tying up the worker
+hasher = PasswordHasher(int(os.environ.get('PAMS_HASH_WORKERS', 2)), int(os.environ.get('PAMS_HASH_QUEUE', 8)))
+
+def server_busy():
+    response = jsonify({'error': 'Server busy, please try again'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
     return response
 
+def upgrade_password_hash(user, password):
+    # Called after a successful login when the stored hash uses old parameters
+    new_hash = hasher.hash(password)
+    with storage.lock('users'):
+        current = storage.load_user('users', user['id'])
+        if current.get('password_hash') != user['password_hash']:
+            return current or user  # changed meanwhile; leave it alone
+        current['password_hash'] = new_hash
+        storage.put('users', current['id'], current)
+    return current
+
 @app.route('/register', methods=['GET', 'POST'])
 @limiter.limit("5 per minute")
 def register():
@@ -163,34 +461,38 @@ def register():
         if len(data['password']) < 6:
             return jsonify({'error': 'Password must be at least 6 characters'}), 400
         
-        # Check if email already exists
-        users = load_data('users')
-        for user in users.values():
-            if user.get('email', '').lower() == data['email'].lower():
-                return jsonify({'error': 'Email already registered'}), 400
-        
-        # Create parent account only
-        parent_id = str(uuid.uuid4())
-        family_id = str(uuid.uuid4())
-        
-        users[parent_id] = {
-            'id': parent_id,
-            'name': data['parent_name'],
-            'email': data['email'],
-            'role': 'parent',
-            'family_id': family_id,
-            'children': [],  # Will store child IDs
-            'password_hash': generate_password_hash(data['password']),
-            'created_at': datetime.now().isoformat()
-        }
+        try:
+            password_hash = hasher.hash(data['password'])
+        except HasherBusy:
+            return server_busy()
         
-        save_data('users', users)
+        # Hold the users lock across check-and-insert so concurrent workers can't race
+        with storage.lock('users'):
+            # Check if email already exists
+            if storage.find_user_by_email(data['email']):
+                return jsonify({'error': 'Email already registered'}), 400
+            
+            # Create parent account only
+            parent_id = str(uuid.uuid4())
+            family_id = str(uuid.uuid4())
+            
+            parent = {
+                'id': parent_id,
+                'name': data['parent_name'],
+                'email': data['email'],
+                'role': 'parent',
+                'family_id': family_id,
+                'children': [],  # Will store child IDs
+                'password_hash': password_hash,
+                'created_at': datetime.now().isoformat()
+            }
+            storage.put('users', parent_id, parent)
         
         # Auto-login parent
-        session['user_id'] = parent_id
+        start_session(parent)
         return jsonify({'status': 'success', 'redirect': '/parent/setup'})
     
-    return render_template('register.html')
+    return shared_page('register.html')
 
 @app.route('/login', methods=['GET', 'POST'])
 @limiter.limit("10 per minute")
@@ -201,22 +503,23 @@ def login():
         if not all(k in data for k in ['email', 'password']):
             return jsonify({'error': 'Missing credentials'}), 400
         
-        users = load_data('users')
-        user = None
-        
         # Find user by email (parents only)
-        for u in users.values():
-            if u.get('email', '').lower() == data['email'].lower() and u['role'] == 'parent':
-                user = u
-                break
+        user = storage.find_user_by_email(data['email'])
+        if user and user['role'] != 'parent':
+            user = None
         
-        if not user or not check_password_hash(user['password_hash'], data['password']):
-            return jsonify({'error': 'Invalid credentials'}), 401
+        try:
+            if not user or not hasher.verify(user['password_hash'], data['password']):
+                return jsonify({'error': 'Invalid credentials'}), 401
+            if hasher.needs_rehash(user['password_hash']):
+                user = upgrade_password_hash(user, data['password'])
+        except HasherBusy:
+            return server_busy()
         
-        session['user_id'] = user['id']
+        start_session(user)
         return jsonify({'status': 'success', 'redirect': '/parent'})
     
-    return render_template('login.html')
+    return shared_page('login.html')
 
 @app.route('/logout')
 def logout():
@@ -226,64 +529,83 @@ def logout():
 @app.route('/parent/setup')
 @require_auth
 def parent_setup():
-    user = get_current_user()
-    if user['role'] != 'parent':
+    if current_role() != 'parent':
         return redirect('/')
-    return render_template('parent_setup.html', user=user)
+    # Version before data, so a write in between can only make the key stale
+    # (one extra render), never cache old HTML under the new version
+    user_id = session['user_id']
+    version = storage.user_version('users', user_id)
+    user = storage.load_user('users', user_id)
+    return cached_page(('parent_setup.html', user_id, version),
+                       lambda: render_template('parent_setup.html', user=user))
 
 @app.route('/parent')
 @require_auth
 def parent_dashboard():
-    user = get_current_user()
-    if user['role'] != 'parent':
+    if current_role() != 'parent':
         return redirect('/')
-    
-    # Get children data
-    users = load_data('users')
-    children = [users[child_id] for child_id in user.get('children', []) if child_id in users]
-    
-    return render_template('parent_dashboard.html', user=user, children=children)
+    user_id = session['user_id']
+    version = storage.user_version('users', user_id)
+    user = storage.load_user('users', user_id)
+    child_ids = user.get('children', [])
+    versions = (version,) + tuple(storage.user_version('users', uid) for uid in child_ids)
+    
+    def render():
+        # Get children data
+        wanted = set(child_ids)
+        children = [u for u in storage.family_members(user['family_id']) if u['id'] in wanted]
+        return render_template('parent_dashboard.html', user=user, children=children)
+    
+    return cached_page(('parent_dashboard.html', user_id, versions), render)
+
+CHILD_SCHEMA = Schema({
+    'name': Field(str, required=True, max_length=50),
+    'age': Field(int, required=True, low=3, high=25),
+    'sport': Field(str, required=True, max_length=50),
+})
 
 @app.route('/api/add-child', methods=['POST'])
 @limiter.limit("5 per minute")
 @require_auth
+@validate_json(CHILD_SCHEMA)
 def add_child():
-    user = get_current_user()
-    if user['role'] != 'parent':
+    if current_role() != 'parent':
         return jsonify({'error': 'Unauthorized'}), 403
     
-    data = sanitize_input(request.json)
-    if not all(k in data for k in ['name', 'age', 'sport']):
-        return jsonify({'error': 'Missing required fields'}), 400
+    data = g.data
     
     # Create child profile
     child_id = str(uuid.uuid4())
     pin = str(uuid.uuid4())[:6].upper()  # Simple 6-char PIN for child
     
-    users = load_data('users')
-    users[child_id] = {
-        'id': child_id,
-        'name': data['name'],
-        'age': int(data['age']),
-        'sport': data['sport'],
-        'role': 'child',
-        'parent_id': user['id'],
-        'family_id': user['family_id'],
-        'pin': pin,  # Simple PIN instead of password
-        'created_at': datetime.now().isoformat(),
-        'permissions': {
-            'can_checkin': True,
-            'can_view_stats': True,
-            'can_post_social': False  # Parent controls social features
-        }
-    }
-    
-    # Add child to parent's children list
-    user['children'] = user.get('children', [])
-    user['children'].append(child_id)
-    users[user['id']] = user
-    
-    save_data('users', users)
+    with storage.lock('users'):
+        # Re-read the parent under the lock so concurrent adds don't drop children
+        parent = storage.load_user('users', session['user_id'])
+        if not parent:
+            return jsonify({'error': 'User not found'}), 401
+        
+        storage.put('users', child_id, {
+            'id': child_id,
+            'name': data['name'],
+            'age': data['age'],
+            'sport': data['sport'],
+            'role': 'child',
+            'parent_id': parent['id'],
+            'family_id': parent['family_id'],
+            'pin': pin,  # Simple PIN instead of password
+            'created_at': datetime.now().isoformat(),
+            'permissions': {
+                'can_checkin': True,
+                'can_view_stats': True,
+                'can_post_social': False  # Parent controls social features
+            }
+        })
+        
+        # Add child to parent's children list
+        parent['children'] = parent.get('children', [])
+        parent['children'].append(child_id)
+        storage.put('users', parent['id'], parent)
+        g.current_user = (parent['id'], parent)
     
     return jsonify({
         'status': 'success', 
@@ -295,47 +617,42 @@ def add_child():
 @app.route('/athlete')
 @require_auth
 def athlete_app():
-    user = get_current_user()
-    return render_template('athlete_app.html', user=user)
+    return shared_page('athlete_app.html', 'private, no-cache')
 
 @app.route('/athlete/dashboard')
 @require_auth
 def athlete_dashboard():
-    user = get_current_user()
-    return render_template('athlete_dashboard.html', user=user)
+    return shared_page('athlete_dashboard.html', 'private, no-cache')
 
 @app.route('/parent/athlete-view')
 def parent_athlete_view():
-    return render_template('athlete_app.html')  # Parent can access athlete interface
+    return shared_page('athlete_app.html')  # Parent can access athlete interface
 
 @app.route('/parent/child/<child_id>/dashboard')
 @require_auth
 def view_child_dashboard(child_id):
-    user = get_current_user()
-    if user['role'] != 'parent':
+    if current_role() != 'parent':
         return redirect('/')
     
-    # Verify child belongs to parent
-    if child_id not in user.get('children', []):
+    # Verify child belongs to parent (version first, as in parent_setup)
+    version = storage.user_version('users', child_id)
+    child = storage.load_user('users', child_id)
+    if not child or child.get('parent_id') != session['user_id']:
         return redirect('/parent')
     
-    users = load_data('users')
-    child = users.get(child_id)
-    if not child:
-        return redirect('/parent')
-    
-    return render_template('child_dashboard_view.html', child=child)
+    return cached_page(('child_dashboard_view.html', child_id, version),
+                       lambda: render_template('child_dashboard_view.html', child=child))
 
 @app.route('/parent/enhanced')
 def enhanced_dashboard():
-    return render_template('enhanced_dashboard.html')
+    return shared_page('enhanced_dashboard.html')
 
 @app.route('/child/dashboard')
 @require_auth
 def child_dashboard():
-    user = get_current_user()
-    if user['role'] != 'child':
+    if current_role() != 'child':
         return redirect('/')
+    user = get_current_user()
     return render_template('child_dashboard.html', user=user)
 
 @app.route('/child/checkin')
@@ -355,120 +672,205 @@ def child_login():
         if not all(k in data for k in ['name', 'pin']):
             return jsonify({'error': 'Missing credentials'}), 400
         
-        users = load_data('users')
-        child = None
-        
         # Find child by name and PIN
-        for u in users.values():
-            if (u.get('role') == 'child' and 
-                u['name'].lower() == data['name'].lower() and 
-                u.get('pin') == data['pin'].upper()):
-                child = u
-                break
-        
+        child = storage.find_child(data['name'], data['pin'].upper())
         if not child:
             return jsonify({'error': 'Invalid name or PIN'}), 401
         
-        session['user_id'] = child['id']
+        start_session(child)
         return jsonify({'status': 'success', 'redirect': '/child/dashboard'})
     
-    return render_template('child_login.html')
+    return shared_page('child_login.html')
 
 @app.route('/phase2')
 def phase2_features():
-    return render_template('phase2_dashboard.html')
+    return shared_page('phase2_dashboard.html')
 
 @app.route('/coach-communication')
 def coach_communication():
-    return render_template('coach_communication.html')
+    return shared_page('coach_communication.html')
 
 @app.route('/activity-import')
 def activity_import_page():
-    return render_template('activity_import.html')
+    return shared_page('activity_import.html')
 
 @app.route('/soccer-training')
 @require_auth
 def soccer_training():
-    return render_template('soccer_training.html')
+    return shared_page('soccer_training.html', 'private, no-cache')
 
 @app.route('/barca-academy')
 @require_auth
 def barca_academy():
-    return render_template('barca_academy.html')
+    return shared_page('barca_academy.html', 'private, no-cache')
 
 @app.route('/advanced-analytics')
 def advanced_analytics_page():
-    return render_template('advanced_analytics.html')
+    return shared_page('advanced_analytics.html')
 
 @app.route('/mobile')
 def mobile_app():
-    return render_template('mobile_app.html')
+    return shared_page('mobile_app.html')
+
+ACTIVITY_FIELDS = {
+    'steps': Field(int, required=True, low=0, high=200000),
+    'active_minutes': Field(int, required=True, low=0, high=1440),
+    'calories': Field(int, required=True, low=0, high=20000),
+    'distance': Field(float, default=0.0, low=0, high=500),
+    'heart_rate_avg': Field(int, default=0, low=0, high=250),
+}
+ACTIVITY_IMPORT_SCHEMA = Schema(dict(ACTIVITY_FIELDS, source=Field(str, default='phone_app', max_length=50)))
 
 @app.route('/api/activity-import', methods=['POST'])
 @limiter.limit("10 per minute")
 @require_auth
+@validate_json(ACTIVITY_IMPORT_SCHEMA)
 def import_activity_data():
-    if not request.json:
-        return jsonify({'error': 'Invalid data'}), 400
-    
-    user = get_current_user()
-    data = sanitize_input(request.json)
-    
-    # Validate activity data
-    required_fields = ['steps', 'active_minutes', 'calories']
-    if not all(field in data for field in required_fields):
-        return jsonify({'error': 'Missing required fields'}), 400
-    
     today = str(date.today())
-    activity_data = {
-        'steps': int(data['steps']),
-        'active_minutes': int(data['active_minutes']),
-        'calories': int(data['calories']),
-        'distance': float(data.get('distance', 0)),
-        'heart_rate_avg': int(data.get('heart_rate_avg', 0)),
-        'imported_at': datetime.now().isoformat(),
-        'source': data.get('source', 'phone_app')
-    }
+    activity_data = dict(g.data, imported_at=datetime.now().isoformat())
     
-    user_activity = get_user_data('activity_imports')
-    user_activity[today] = activity_data
-    save_user_data('activity_imports', user_activity)
+    save_user_record('activity_imports', today, activity_data)
     
     return jsonify({'status': 'imported', 'date': today})
 
+# Bulk backfill limits: ~10 years of days per request, bounded line size
+BULK_IMPORT_MAX_ROWS = 3660
+BULK_IMPORT_MAX_BYTES = 4 * 1024 * 1024
+BULK_IMPORT_MAX_LINE = 4096
+BULK_IMPORT_MAX_ERRORS = 50
+
+BULK_ROW_SCHEMA = Schema(dict(ACTIVITY_FIELDS, date=Field(date, required=True),
+                              source=Field(str, default='bulk_import', max_length=50)))
+
+def parse_activity_row(row):
+    # One bulk-import row (JSON object or CSV dict) -> (date key, record)
+    if not isinstance(row, dict):
+        raise ValueError('Row must be an object')
+    record, errors = BULK_ROW_SCHEMA.validate(row)
+    if errors:
+        raise ValueError(next(iter(errors.values())))
+    
+    day = record.pop('date')
+    if day > str(date.today()):
+        raise ValueError('Date is in the future')
+    record['imported_at'] = datetime.now().isoformat()
+    return day, record
+
+def iter_body_lines(stream):
+    # Decoded lines of the request body; None stands in for an overlong line
+    while True:
+        raw = stream.readline(BULK_IMPORT_MAX_LINE + 1)
+        if not raw:
+            return
+        if len(raw) > BULK_IMPORT_MAX_LINE and not raw.endswith(b'\n'):
+            while raw and not raw.endswith(b'\n'):
+                raw = stream.readline(BULK_IMPORT_MAX_LINE + 1)  # discard the rest of the line
+            yield None
+            continue
+        yield raw.decode('utf-8', errors='replace')
+
+def iter_bulk_rows(stream, content_type):
+    # Yields (line number, row, error) without buffering the body
+    header = None
+    for number, line in enumerate(iter_body_lines(stream), 1):
+        if line is None:
+            yield number, None, 'Line too long'
+            continue
+        if not line.strip():
+            continue
+        if content_type != 'text/csv':
+            try:
+                yield number, jsoncodec.loads(line), None
+            except ValueError:
+                yield number, None, 'Invalid JSON'
+            continue
+        
+        # CSV is parsed a line at a time, so quoted fields can't span lines
+        values = next(csv.reader([line]))
+        if header is None:
+            header = [name.strip() for name in values]
+        elif len(values) > len(header):
+            yield number, None, 'Too many columns'
+        else:
+            yield number, dict(zip(header, values)), None
+
+@app.route('/api/activity-import/bulk', methods=['POST'])
+@limiter.limit("5 per minute")
+@require_auth
+def bulk_import_activity_data():
+    # Backfill many days at once from NDJSON (one JSON object per line) or
+    # CSV with a header row; rows need date, steps, active_minutes, calories
+    content_type = request.mimetype
+    if content_type not in ('application/x-ndjson', 'application/jsonl', 'text/csv'):
+        return jsonify({'error': 'Send application/x-ndjson or text/csv'}), 415
+    if request.content_length and request.content_length > BULK_IMPORT_MAX_BYTES:
+        return jsonify({'error': 'Payload too large'}), 413
+    
+    user = get_current_user()
+    if not user:
+        return jsonify({'error': 'User not found'}), 401
+    
+    records = {}
+    errors = []
+    rejected = 0
+    rows = 0
+    for line, row, error in iter_bulk_rows(request.stream, content_type):
+        rows += 1
+        if rows > BULK_IMPORT_MAX_ROWS:
+            return jsonify({'error': f'Too many rows (max {BULK_IMPORT_MAX_ROWS})'}), 413
+        if error is None:
+            try:
+                key, record = parse_activity_row(row)
+                records[key] = record  # a later row for the same date wins
+                continue
+            except ValueError as e:
+                error = str(e)
+        rejected += 1
+        if len(errors) < BULK_IMPORT_MAX_ERRORS:
+            errors.append({'line': line, 'error': error})
+    
+    if not records:
+        return jsonify({'error': 'No valid rows', 'rejected': rejected, 'errors': errors}), 400
+    
+    save_user_records('activity_imports', records, user['id'])
+    
+    return jsonify({
+        'status': 'imported' if not rejected else 'partial',
+        'imported': len(records),
+        'rejected': rejected,
+        'first_date': min(records),
+        'last_date': max(records),
+        'errors': errors
+    })
+
+CHECKIN_SCHEMA = Schema({
+    'sleep_hours': Field(float, required=True, low=0, high=24),
+    'mood': Field(int, required=True, low=1, high=5),
+    'water_bottles': Field(int, required=True, low=0, high=20),
+    'training_completed': Field(bool, default=False),
+    'homework_done': Field(bool, default=False),
+    'protein_level': Field(str, max_length=20),
+    'gratitude': Field(str, max_length=500),
+    'notes': Field(str, max_length=1000),
+})
+
 @app.route('/api/checkin', methods=['POST'])
 @limiter.limit("10 per minute")
 @require_auth
+@validate_json(CHECKIN_SCHEMA)
 def daily_checkin():
-    try:
-        if not request.json:
-            return jsonify({'error': 'Invalid JSON'}), 400
-        
-        user = get_current_user()
-        if not user:
-            return jsonify({'error': 'User not found'}), 401
-            
-        data = sanitize_input(request.json)
-    except Exception as e:
-        return jsonify({'error': 'Invalid request data'}), 400
-    
-    # Validate required fields and ranges
-    if not isinstance(data.get('sleep_hours'), (int, float)) or not (0 <= data.get('sleep_hours', 0) <= 24):
-        return jsonify({'error': 'Invalid sleep hours'}), 400
-    if not isinstance(data.get('mood'), int) or not (1 <= data.get('mood', 0) <= 5):
-        return jsonify({'error': 'Invalid mood value'}), 400
-    if not isinstance(data.get('water_bottles'), int) or not (0 <= data.get('water_bottles', 0) <= 20):
-        return jsonify({'error': 'Invalid water bottles'}), 400
+    user = get_current_user()
+    if not user:
+        return jsonify({'error': 'User not found'}), 401
     
+    data = g.data
     today = str(date.today())
     data['user_id'] = user['id']
     data['athlete_name'] = user['name']
     data['timestamp'] = datetime.now().isoformat()
     
-    # Get user's checkin data
-    user_checkins = get_user_data('checkins')
-    user_checkins[today] = data
-    save_user_data('checkins', user_checkins)
+    # Store today's checkin for the user
+    save_user_record('checkins', today, data)
     
     insights = generate_daily_insights(data)
     
@@ -505,33 +907,36 @@ def generate_daily_insights(data):
     
     return insights
 
+@app.route('/api/checkins')
+@require_auth
+@conditional_get(('checkins',))
+def list_checkins():
+    try:
+        checkins, next_cursor = get_user_page('checkins', 14)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'checkins': [dict(record, date=key) for key, record in checkins], 'next_cursor': next_cursor})
+
 @app.route('/api/data/<date_str>')
 def get_data(date_str):
     checkins = load_data('checkins')
     return jsonify(checkins.get(date_str, {}))
 
-@app.route('/api/schedule')
-def smart_schedule():
-    from datetime import datetime, timedelta
-    import calendar
-    
-    today = datetime.now()
-    checkins = load_data('checkins')
-    recent_data = list(checkins.values())[-3:]  # Last 3 days
-    
+def build_schedule(recent, now):
     suggestions = []
     
     # Adaptive scheduling based on recent performance
-    avg_sleep = sum(d.get('sleep_hours', 8) for d in recent_data) / max(len(recent_data), 1)
-    avg_mood = sum(d.get('mood', 3) for d in recent_data) / max(len(recent_data), 1)
+    means = window_means(recent, {'sleep_hours': 8, 'mood': 3})
+    avg_sleep = means['sleep_hours']
+    avg_mood = means['mood']
     
-    if today.hour < 12:
+    if now.hour < 12:
         if avg_sleep < 7.5:
             suggestions.append({'time': '4:00 PM', 'activity': '😴 Light Recovery Session', 'priority': 'high', 'reason': 'Low sleep detected'})
         else:
             suggestions.append({'time': '4:30 PM', 'activity': '⚽ Training Session', 'priority': 'high'})
         
-        if calendar.weekday(today.year, today.month, today.day) in [5, 6]:  # Weekend
+        if calendar.weekday(now.year, now.month, now.day) in [5, 6]:  # Weekend
             suggestions.append({'time': '10:00 AM', 'activity': '🏃 Extra Skills Practice', 'priority': 'medium'})
     else:
         if avg_mood < 3:
@@ -539,43 +944,19 @@ def smart_schedule():
         else:
             suggestions.append({'time': '8:30 PM', 'activity': '🧘 Mental Balance', 'priority': 'medium'})
     
-    return jsonify({'suggestions': suggestions})
+    return {'suggestions': suggestions}
+
+@app.route('/api/schedule')
+def smart_schedule():
+    recent = get_user_series('checkins').last(3)  # Last 3 days
+    return jsonify(build_schedule(recent, datetime.now()))
 
 @app.route('/api/injury-risk')
 def injury_risk_assessment():
-    checkins = load_data('checkins')
-    recent_data = list(checkins.values())[-7:]  # Last 7 days
-    
-    if len(recent_data) < 3:
-        return jsonify({'risk_level': 'unknown', 'score': 0})
-    
-    # Risk factors
-    sleep_risk = sum(1 for d in recent_data if d.get('sleep_hours', 8) < 7) / len(recent_data)
-    training_load = sum(1 for d in recent_data if d.get('training_completed')) / len(recent_data)
-    mood_risk = sum(1 for d in recent_data if d.get('mood', 3) < 3) / len(recent_data)
-    
-    # Calculate risk score (0-100)
-    risk_score = (sleep_risk * 40) + (training_load * 30) + (mood_risk * 30)
-    
-    if risk_score > 60: risk_level = 'high'
-    elif risk_score > 30: risk_level = 'moderate'
-    else: risk_level = 'low'
-    
-    return jsonify({
-        'risk_level': risk_level,
-        'score': round(risk_score, 1),
-        'factors': {
-            'sleep_issues': round(sleep_risk * 100, 1),
-            'training_load': round(training_load * 100, 1),
-            'mood_concerns': round(mood_risk * 100, 1)
-        }
-    })
+    recent = get_user_series('checkins').last(7)  # Last 7 days
+    return jsonify(injury_risk_summary(recent))
 
-@app.route('/api/nutrition-ai')
-def nutrition_recommendations():
-    checkins = load_data('checkins')
-    today_data = checkins.get(str(date.today()), {})
-    
+def build_nutrition(today_data, now):
     recommendations = []
     
     # Hydration check
@@ -599,47 +980,72 @@ def nutrition_recommendations():
         })
     
     # Pre-sleep nutrition
-    from datetime import datetime
-    if datetime.now().hour >= 20:
+    if now.hour >= 20:
         recommendations.append({
             'type': 'recovery',
             'message': 'Consider light snack with protein for overnight recovery',
             'priority': 'medium'
         })
     
-    return jsonify({'recommendations': recommendations})
+    return {'recommendations': recommendations}
+
+@app.route('/api/nutrition-ai')
+def nutrition_recommendations():
+    today_data = get_user_record('checkins', str(date.today()))
+    return jsonify(build_nutrition(today_data, datetime.now()))
+
+GOAL_SCHEMA = Schema({
+    'title': Field(str, required=True, max_length=100),
+    'target': Field(str, max_length=200),
+    'deadline': Field(date),
+    'progress': Field(int, default=0, low=0, high=100),
+})
 
 @app.route('/api/goals', methods=['GET', 'POST'])
+@validate_json(GOAL_SCHEMA)
+@conditional_get(('goals',), per_user=False)
 def goals_management():
-    goals_data = load_data('goals')
-    
     if request.method == 'POST':
-        goal = request.json
-        goal['id'] = len(goals_data) + 1
+        goal = g.data
+        goal['id'] = uuid.uuid4().hex
         goal['created_date'] = str(date.today())
         goal['status'] = 'active'
-        goals_data[str(goal['id'])] = goal
-        save_data('goals', goals_data)
+        # One journal entry under the storage lock, so concurrent posts can't drop each other
+        storage.put('goals', goal['id'], goal)
         return jsonify({'status': 'success', 'goal_id': goal['id']})
     
-    return jsonify({'goals': list(goals_data.values())})
+    return jsonify({'goals': list(load_data('goals').values())})
+
+GROWTH_SCHEMA = Schema({
+    'height': Field(float, low=0, high=300),
+    'weight': Field(float, low=0, high=500),
+    'height_inches': Field(float, low=0, high=120),
+    'weight_lbs': Field(float, low=0, high=1000),
+})
 
 @app.route('/api/growth-tracking', methods=['GET', 'POST'])
+@validate_json(GROWTH_SCHEMA)
+@conditional_get(('growth',), per_user=False)
 def growth_tracking():
-    growth_data = load_data('growth')
-    
     if request.method == 'POST':
-        data = request.json
-        today = str(date.today())
-        growth_data[today] = data
-        save_data('growth', growth_data)
+        data = g.data
+        if not data:
+            return jsonify({'error': 'No measurements provided'}), 400
+        storage.put('growth', str(date.today()), data)
         return jsonify({'status': 'success'})
     
+    growth_data = load_data('growth')
+    try:
+        limit, before = page_params(24)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    history, next_cursor = finish_page(page_items(growth_data.items(), limit + 1, before), limit)
+    
     # Calculate growth trends
-    recent_entries = list(growth_data.items())[-12:]  # Last 12 entries
+    recent_entries = [record for _, record in page_items(growth_data.items(), 12)]  # Last 12 entries, newest first
     if len(recent_entries) >= 2:
-        latest = recent_entries[-1][1]
-        previous = recent_entries[0][1]
+        latest = recent_entries[0]
+        previous = recent_entries[-1]
         
         height_change = latest.get('height', 0) - previous.get('height', 0)
         weight_change = latest.get('weight', 0) - previous.get('weight', 0)
@@ -653,7 +1059,7 @@ def growth_tracking():
     else:
         trends = {'height_change': 0, 'weight_change': 0, 'latest_height': 0, 'latest_weight': 0}
     
-    return jsonify({'trends': trends, 'history': growth_data})
+    return jsonify({'trends': trends, 'history': dict(history), 'next_cursor': next_cursor})
 
 @app.route('/api/wearable-sync', methods=['POST'])
 def wearable_sync():
@@ -662,50 +1068,60 @@ def wearable_sync():
     today = str(date.today())
     
     # Store wearable data
-    wearables = load_data('wearables')
-    wearables[today] = {
+    storage.put('wearables', today, {
         'heart_rate_avg': wearable_data.get('heart_rate_avg', 0),
         'steps': wearable_data.get('steps', 0),
         'sleep_quality': wearable_data.get('sleep_quality', 0),
         'recovery_score': wearable_data.get('recovery_score', 0)
-    }
-    save_data('wearables', wearables)
+    })
     
     return jsonify({'status': 'synced', 'data_points': len(wearable_data)})
 
+TRAINING_SCHEMA = Schema({
+    'session_type': Field(str, max_length=30),
+    'duration': Field(int, default=0, low=0, high=600),
+    'skills_practiced': Field(list, default=[], max_length=20),
+    'technical_rating': Field(int, default=0, low=0, high=10),
+    'physical_rating': Field(int, default=0, low=0, high=10),
+    'mental_rating': Field(int, default=0, low=0, high=10),
+    'notes': Field(str, default='', max_length=1000),
+})
+
 @app.route('/api/soccer-training', methods=['GET', 'POST'])
 @limiter.limit("20 per minute")
 @require_auth
+@validate_json(TRAINING_SCHEMA)
+@conditional_get(('soccer_training',))
 def soccer_training_api():
     user = get_current_user()
     
     if request.method == 'POST':
-        data = sanitize_input(request.json)
+        data = g.data
         today = str(date.today())
         
         training_session = {
             'date': today,
             'session_type': data.get('session_type'),
-            'duration': int(data.get('duration', 0)),
-            'skills_practiced': data.get('skills_practiced', []),
-            'technical_rating': int(data.get('technical_rating', 0)),
-            'physical_rating': int(data.get('physical_rating', 0)),
-            'mental_rating': int(data.get('mental_rating', 0)),
-            'notes': data.get('notes', ''),
+            'duration': data['duration'],
+            'skills_practiced': data['skills_practiced'],
+            'technical_rating': data['technical_rating'],
+            'physical_rating': data['physical_rating'],
+            'mental_rating': data['mental_rating'],
+            'notes': data['notes'],
             'timestamp': datetime.now().isoformat()
         }
         
-        user_training = get_user_data('soccer_training')
-        user_training[today] = training_session
-        save_user_data('soccer_training', user_training)
+        save_user_record('soccer_training', today, training_session)
         
         return jsonify({'status': 'success', 'session_id': today})
     
     # GET - return recent training sessions
-    user_training = get_user_data('soccer_training')
-    recent_sessions = list(user_training.values())[-7:]
+    try:
+        sessions, next_cursor = get_user_page('soccer_training', 7)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    return jsonify({'sessions': recent_sessions})
+    return jsonify({'sessions': [record for _, record in sessions], 'next_cursor': next_cursor})
 
 @app.route('/api/barca-program')
 @require_auth
@@ -756,171 +1172,163 @@ def get_barca_program():
     
     return jsonify(program)
 
-@app.route('/api/skill-assessment', methods=['POST'])
-@limiter.limit("10 per minute")
+SKILLS = ('ball_control', 'passing', 'shooting', 'dribbling', 'heading', 'speed', 'agility', 'strength',
+          'endurance', 'decision_making', 'game_intelligence', 'leadership', 'composure')
+SKILL_ASSESSMENT_SCHEMA = Schema(dict(
+    {skill: Field(int, default=0, low=0, high=10) for skill in SKILLS},
+    assessor=Field(str, default='Self', max_length=100),
+    notes=Field(str, default='', max_length=1000)
+))
+
+@app.route('/api/skill-assessment', methods=['GET', 'POST'])
+@limiter.limit("10 per minute", methods=['POST'])
 @require_auth
+@validate_json(SKILL_ASSESSMENT_SCHEMA)
+@conditional_get(('skill_assessments',))
 def skill_assessment():
+    if request.method == 'GET':
+        try:
+            assessments, next_cursor = get_user_page('skill_assessments', 10)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({'assessments': [record for _, record in assessments], 'next_cursor': next_cursor})
+    
     user = get_current_user()
-    data = sanitize_input(request.json)
+    data = g.data
     
     assessment = {
         'date': str(date.today()),
         'technical_skills': {
-            'ball_control': int(data.get('ball_control', 0)),
-            'passing': int(data.get('passing', 0)),
-            'shooting': int(data.get('shooting', 0)),
-            'dribbling': int(data.get('dribbling', 0)),
-            'heading': int(data.get('heading', 0))
+            'ball_control': data['ball_control'],
+            'passing': data['passing'],
+            'shooting': data['shooting'],
+            'dribbling': data['dribbling'],
+            'heading': data['heading']
         },
         'physical_attributes': {
-            'speed': int(data.get('speed', 0)),
-            'agility': int(data.get('agility', 0)),
-            'strength': int(data.get('strength', 0)),
-            'endurance': int(data.get('endurance', 0))
+            'speed': data['speed'],
+            'agility': data['agility'],
+            'strength': data['strength'],
+            'endurance': data['endurance']
         },
         'mental_aspects': {
-            'decision_making': int(data.get('decision_making', 0)),
-            'game_intelligence': int(data.get('game_intelligence', 0)),
-            'leadership': int(data.get('leadership', 0)),
-            'composure': int(data.get('composure', 0))
+            'decision_making': data['decision_making'],
+            'game_intelligence': data['game_intelligence'],
+            'leadership': data['leadership'],
+            'composure': data['composure']
         },
-        'assessor': data.get('assessor', 'Self'),
-        'notes': data.get('notes', ''),
+        'assessor': data['assessor'],
+        'notes': data['notes'],
         'timestamp': datetime.now().isoformat()
     }
     
-    user_assessments = get_user_data('skill_assessments')
-    user_assessments[str(date.today())] = assessment
-    save_user_data('skill_assessments', user_assessments)
+    save_user_record('skill_assessments', str(date.today()), assessment)
     
     return jsonify({'status': 'success', 'assessment_id': str(date.today())})
 
 @app.route('/api/activity-stats')
 @require_auth
 def get_activity_stats():
-    user_activity = get_user_data('activity_imports')
-    recent_data = list(user_activity.values())[-7:]  # Last 7 days
-    
-    if not recent_data:
-        return jsonify({'status': 'no_data'})
-    
-    avg_steps = sum(d.get('steps', 0) for d in recent_data) / len(recent_data)
-    avg_active_minutes = sum(d.get('active_minutes', 0) for d in recent_data) / len(recent_data)
-    avg_calories = sum(d.get('calories', 0) for d in recent_data) / len(recent_data)
-    
-    return jsonify({
-        'avg_steps': round(avg_steps),
-        'avg_active_minutes': round(avg_active_minutes),
-        'avg_calories': round(avg_calories),
-        'days_tracked': len(recent_data),
-        'step_goal_met': sum(1 for d in recent_data if d.get('steps', 0) >= 10000),
-        'activity_goal_met': sum(1 for d in recent_data if d.get('active_minutes', 0) >= 60)
-    })
+    recent = get_user_rollup('activity_imports').window(7)  # Last 7 days
+    return jsonify(activity_from_rollup(recent))
 
+COMPETITION_SCHEMA = Schema({
+    'name': Field(str, required=True, max_length=100),
+    'date': Field(date, required=True),
+    'type': Field(str, default='tournament', max_length=30),
+    'importance': Field(str, default='medium', choices=('low', 'medium', 'high')),
+    'location': Field(str, max_length=200),
+})
 
+# Competitions are stored per family (collection competitions, keyed by
+# family id, then event id) and read through a date-ordered index. Events
+# from the old single-calendar layout (keyed by event id alone) live under
+# LEGACY_COMPETITIONS and are listed for every family.
+LEGACY_COMPETITIONS = '_legacy'
 
+def migrate_legacy_competitions():
+    # One-off move of old top-level events under LEGACY_COMPETITIONS. Runs at
+    # startup under the collection lock, so a worker only serves once it's
+    # done and later workers find nothing left to move.
+    with storage.lock('competitions'):
+        data = storage.load('competitions')
+        legacy = {str(key): dict(event, id=str(event.get('id', key))) for key, event in data.items()
+                  if isinstance(event, dict) and 'date' in event}
+        if not legacy:
+            return 0
+        data = {key: value for key, value in data.items() if str(key) not in legacy}
+        data[LEGACY_COMPETITIONS] = dict(data.get(LEGACY_COMPETITIONS) or {}, **legacy)
+        storage.save('competitions', data)
+    return len(legacy)
 
+migrate_legacy_competitions()
 
 @app.route('/api/competition-calendar', methods=['GET', 'POST'])
+@require_auth
+@validate_json(COMPETITION_SCHEMA)
 def competition_calendar():
-    calendar_data = load_data('competitions')
+    family_id = current_family()
     
     if request.method == 'POST':
-        event = request.json
-        event['id'] = len(calendar_data) + 1
-        calendar_data[str(event['id'])] = event
-        save_data('competitions', calendar_data)
-        return jsonify({'status': 'success'})
-    
-    # Get upcoming events
-    from datetime import datetime, timedelta
-    today = datetime.now().date()
-    upcoming = []
+        event = g.data
+        event['id'] = uuid.uuid4().hex
+        event['created_by'] = session['user_id']
+        storage.put_record('competitions', family_id, event['id'], event)
+        return jsonify({'status': 'success', 'event_id': event['id']})
     
-    for event in calendar_data.values():
-        event_date = datetime.strptime(event['date'], '%Y-%m-%d').date()
-        if event_date >= today:
-            days_until = (event_date - today).days
-            event['days_until'] = days_until
-            upcoming.append(event)
-    
-    upcoming.sort(key=lambda x: x['days_until'])
-    
-    return jsonify({'upcoming_events': upcoming[:5]})
+    # Upcoming events by default; ?from= and ?to= select a date range
+    try:
+        limit = min(int(request.args.get('limit', 5)), MAX_PAGE_SIZE)
+        start = request.args.get('from')
+        end = request.args.get('to')
+        start = str(date.fromisoformat(start)) if start else None
+        end = str(date.fromisoformat(end)) if end else None
+    except ValueError:
+        return jsonify({'error': 'Invalid date range or limit'}), 400
+    if limit < 1:
+        return jsonify({'error': 'Invalid date range or limit'}), 400
+    
+    events = calendar_cache.get(storage, 'competitions', family_id, LEGACY_COMPETITIONS)
+    if start is None and end is None:
+        return jsonify({'upcoming_events': events.upcoming(limit)})
+    return jsonify({'events': events.between(start, end, limit)})
+
+@app.route('/api/competition-calendar/<event_id>', methods=['DELETE'])
+@require_auth
+def delete_competition(event_id):
+    family_id = current_family()
+    with storage.lock('competitions', family_id):
+        events = storage.load_user('competitions', family_id)
+        if event_id in events:
+            del events[event_id]
+            storage.save_user('competitions', family_id, events)
+            return jsonify({'status': 'success'})
+    # Shared legacy events can only be removed by a parent
+    if current_role() == 'parent':
+        with storage.lock('competitions', LEGACY_COMPETITIONS):
+            events = storage.load_user('competitions', LEGACY_COMPETITIONS)
+            if event_id in events:
+                del events[event_id]
+                storage.save_user('competitions', LEGACY_COMPETITIONS, events)
+                return jsonify({'status': 'success'})
+    return jsonify({'error': 'Event not found'}), 404
 
 @app.route('/api/sleep-analysis')
 def sleep_analysis():
-    checkins = load_data('checkins')
-    recent_data = list(checkins.values())[-30:]  # Last 30 days
-    
-    if not recent_data:
-        return jsonify({'status': 'no_data'})
-    
-    sleep_data = [d.get('sleep_hours', 0) for d in recent_data]
-    mood_data = [d.get('mood', 0) for d in recent_data]
-    
-    # Sleep quality analysis
-    avg_sleep = sum(sleep_data) / len(sleep_data)
-    sleep_consistency = 1 - (max(sleep_data) - min(sleep_data)) / 12  # 0-1 scale
-    
-    # Sleep-mood correlation
-    good_sleep_days = [i for i, s in enumerate(sleep_data) if s >= 8]
-    avg_mood_good_sleep = sum(mood_data[i] for i in good_sleep_days) / max(len(good_sleep_days), 1)
-    
-    return jsonify({
-        'average_sleep': round(avg_sleep, 1),
-        'consistency_score': round(sleep_consistency * 100, 1),
-        'optimal_sleep_days': len([s for s in sleep_data if s >= 8]),
-        'mood_correlation': round(avg_mood_good_sleep, 1),
-        'recommendations': [
-            'Target 9 hours nightly' if avg_sleep < 8.5 else 'Excellent sleep duration',
-            'Improve consistency' if sleep_consistency < 0.8 else 'Great sleep routine'
-        ]
-    })
+    recent = get_user_rollup('checkins').window(30)  # Last 30 days
+    return jsonify(sleep_from_rollup(recent))
 
 @app.route('/api/performance-trends')
 def performance_trends():
-    checkins = load_data('checkins')
-    recent_data = list(checkins.values())[-14:]  # Last 2 weeks
-    
-    if len(recent_data) < 7:
-        return jsonify({'status': 'insufficient_data'})
-    
-    # Split into two weeks
-    week1 = recent_data[:7]
-    week2 = recent_data[7:]
-    
-    def week_stats(data):
-        return {
-            'avg_sleep': sum(d.get('sleep_hours', 0) for d in data) / len(data),
-            'avg_mood': sum(d.get('mood', 0) for d in data) / len(data),
-            'training_rate': sum(1 for d in data if d.get('training_completed')) / len(data) * 100,
-            'hydration': sum(d.get('water_bottles', 0) for d in data) / len(data)
-        }
-    
-    w1_stats = week_stats(week1)
-    w2_stats = week_stats(week2)
-    
-    trends = {
-        'sleep_trend': 'improving' if w2_stats['avg_sleep'] > w1_stats['avg_sleep'] else 'declining',
-        'mood_trend': 'improving' if w2_stats['avg_mood'] > w1_stats['avg_mood'] else 'declining',
-        'training_trend': 'improving' if w2_stats['training_rate'] > w1_stats['training_rate'] else 'declining',
-        'hydration_trend': 'improving' if w2_stats['hydration'] > w1_stats['hydration'] else 'declining'
-    }
-    
-    return jsonify({
-        'week1': w1_stats,
-        'week2': w2_stats,
-        'trends': trends,
-        'overall_direction': 'positive' if sum(1 for t in trends.values() if t == 'improving') >= 3 else 'needs_attention'
-    })
+    recent = get_user_series('checkins').last(14)  # Last 2 weeks
+    return jsonify(trend_summary(recent))
 
 @app.route('/api/team-social', methods=['GET', 'POST'])
 @limiter.limit("20 per minute")
 @require_auth
+@conditional_get(('team_social',))
 def team_social():
     user = get_current_user()
-    family_social = get_user_data('team_social')
     
     if request.method == 'POST':
         if not request.json or 'content' not in request.json:
@@ -940,107 +1348,86 @@ def team_social():
             'likes': 0
         }
         
-        family_social[post['id']] = post
-        save_user_data('team_social', family_social)
+        save_user_record('team_social', post['id'], post)
         return jsonify({'status': 'posted', 'post_id': post['id']})
     
-    recent_posts = list(family_social.values())[-10:]
-    return jsonify({'posts': recent_posts})
+    try:
+        posts, next_cursor = get_user_page('team_social', 10, order_field='timestamp')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'posts': [record for _, record in posts], 'next_cursor': next_cursor})
 
 @app.route('/api/recovery-optimizer')
 @require_auth
 def recovery_optimizer():
-    user_checkins = get_user_data('checkins')
-    recent_data = list(user_checkins.values())[-7:]  # Last week
-    
-    if not recent_data:
-        return jsonify({'status': 'no_data'})
-    
-    # Calculate recovery metrics
-    avg_sleep = sum(d.get('sleep_hours', 0) for d in recent_data) / len(recent_data)
-    avg_mood = sum(d.get('mood', 0) for d in recent_data) / len(recent_data)
-    training_load = sum(1 for d in recent_data if d.get('training_completed'))
-    
-    # Recovery recommendations
-    recommendations = []
-    if avg_sleep < 8:
-        recommendations.append({'type': 'sleep', 'priority': 'high', 'action': 'Increase sleep by 30-60 minutes'})
-    if avg_mood < 3.5:
-        recommendations.append({'type': 'mental', 'priority': 'medium', 'action': 'Add meditation or relaxation time'})
-    if training_load > 5:
-        recommendations.append({'type': 'training', 'priority': 'high', 'action': 'Schedule active recovery day'})
-    
-    recovery_score = min(100, (avg_sleep/9 * 40) + (avg_mood/5 * 35) + ((7-training_load)/7 * 25))
-    
-    return jsonify({
-        'recovery_score': round(recovery_score, 1),
-        'sleep_quality': round(avg_sleep, 1),
-        'mental_state': round(avg_mood, 1),
-        'training_load': training_load,
-        'recommendations': recommendations,
-        'next_action': recommendations[0]['action'] if recommendations else 'Maintain current routine'
-    })
+    recent = get_user_rollup('checkins').window(7)  # Last week
+    return jsonify(recovery_from_rollup(recent))
 
 @app.route('/api/analytics')
 @require_auth
+@conditional_get(('checkins',))
 def get_analytics():
-    user_checkins = get_user_data('checkins')
-    recent_data = list(user_checkins.values())[-7:]  # Last 7 days
-    
-    if not recent_data:
-        return jsonify({'predictability_index': 0, 'status': 'No data'})
-    
-    # Core metrics
-    avg_sleep = sum(d.get('sleep_hours', 0) for d in recent_data) / len(recent_data)
-    avg_mood = sum(d.get('mood', 0) for d in recent_data) / len(recent_data)
-    training_consistency = sum(1 for d in recent_data if d.get('training_completed')) / len(recent_data) * 100
-    homework_completion = sum(1 for d in recent_data if d.get('homework_done')) / len(recent_data) * 100
-    avg_hydration = sum(d.get('water_bottles', 0) for d in recent_data) / len(recent_data)
-    
-    # Predictability Index (0-100)
-    sleep_score = min(100, (avg_sleep / 9.0) * 100)  # Target: 9 hours
-    nutrition_score = min(100, (avg_hydration / 8.0) * 100)  # Target: 8 bottles
-    recovery_score = min(100, (avg_mood / 5.0) * 100)  # Target: 5/5 mood
-    training_score = training_consistency
-    mental_score = min(100, (avg_mood / 5.0) * 100)
-    
-    predictability_index = (
-        sleep_score * 0.25 +
-        nutrition_score * 0.25 +
-        recovery_score * 0.20 +
-        training_score * 0.15 +
-        mental_score * 0.15
-    )
-    
-    # Status color coding
-    if predictability_index >= 80: status = '🟢 Optimal'
-    elif predictability_index >= 60: status = '🟡 Moderate'
-    else: status = '🔴 Overload'
-    
-    # AI Alerts
-    alerts = []
-    if avg_sleep < 8: alerts.append('⚠️ Sleep below target - injury risk increased')
-    if avg_hydration < 6: alerts.append('💧 Hydration low - performance may suffer')
-    if training_consistency > 85 and avg_sleep < 8: alerts.append('🚨 High training + low sleep = overload risk')
-    if avg_mood < 3: alerts.append('😟 Mood trending low - consider rest day')
+    recent = get_user_rollup('checkins').window(7)  # Last 7 days
+    return jsonify(analytics_from_rollup(recent))
+
+DASHBOARD_SECTIONS = ('analytics', 'recovery', 'sleep', 'trends', 'injury_risk', 'nutrition', 'schedule', 'activity')
+
+@app.route('/api/dashboard')
+@require_auth
+def dashboard():
+    # Every dashboard section from one load of the user's series, e.g.
+    # /api/dashboard?fields=analytics,injury_risk,nutrition
+    user = get_current_user()
+    if not user:
+        return jsonify({'error': 'User not found'}), 401
+    
+    fields = request.args.get('fields')
+    fields = [f.strip() for f in fields.split(',') if f.strip()] if fields else list(DASHBOARD_SECTIONS)
+    unknown = [f for f in fields if f not in DASHBOARD_SECTIONS]
+    if unknown:
+        return jsonify({'error': f'Unknown fields: {", ".join(unknown)}'}), 400
+    
+    checkins = get_user_series('checkins', user['id'])
+    rollup = get_user_rollup('checkins', user['id'])
+    now = datetime.now()
+    builders = {
+        'analytics': lambda: analytics_from_rollup(rollup.window(7)),
+        'recovery': lambda: recovery_from_rollup(rollup.window(7)),
+        'sleep': lambda: sleep_from_rollup(rollup.window(30)),
+        'trends': lambda: trend_summary(checkins.last(14)),
+        'injury_risk': lambda: injury_risk_summary(checkins.last(7)),
+        'nutrition': lambda: build_nutrition(get_user_record('checkins', str(date.today()), user['id']), now),
+        'schedule': lambda: build_schedule(checkins.last(3), now),
+        'activity': lambda: activity_from_rollup(get_user_rollup('activity_imports', user['id']).window(7))
+    }
     
-    return jsonify({
-        'predictability_index': round(predictability_index, 1),
-        'status': status,
-        'avg_sleep': avg_sleep,
-        'avg_mood': avg_mood,
-        'training_consistency': training_consistency,
-        'homework_completion': homework_completion,
-        'avg_hydration': avg_hydration,
-        'alerts': alerts,
-        'scores': {
-            'sleep': round(sleep_score, 1),
-            'nutrition': round(nutrition_score, 1),
-            'recovery': round(recovery_score, 1),
-            'training': round(training_score, 1),
-            'mental': round(mental_score, 1)
-        }
-    })
+    return jsonify({field: builders[field]() for field in fields})
+
+@app.route('/api/parent/summary')
+@require_auth
+def parent_summary():
+    # Analytics, injury risk and recovery for every child of the parent, from
+    # one read of users and one of checkins, scored together in a single batch
+    if current_role() != 'parent':
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    children = [u for u in storage.family_members(session['family_id']) if u.get('parent_id') == session['user_id']]
+    checkins = storage.load_users('checkins', [child['id'] for child in children])
+    windows = [TimeSeries(checkins[child['id']], SERIES_FIELDS['checkins']).last(7) for child in children]
+    
+    analytics = analytics_batch(windows)
+    injury_risk = injury_risk_batch(windows)
+    recovery = recovery_batch(windows)
+    
+    return jsonify({'children': [{
+        'id': child['id'],
+        'name': child['name'],
+        'age': child.get('age'),
+        'sport': child.get('sport'),
+        'analytics': analytics[i],
+        'injury_risk': injury_risk[i],
+        'recovery': recovery[i]
+    } for i, child in enumerate(children)]})
 
 # Initialize empty data structure
 def init_data_structure():
@@ -1049,9 +1436,9 @@ def init_data_structure():
         os.makedirs(DATA_DIR)
     
     # Initialize empty data files if they don't exist
-    data_files = ['users', 'checkins', 'goals', 'competitions', 'team_social', 'growth', 'wearables', 'activity_imports', 'soccer_training', 'skill_assessments']
+    data_files = ['users', 'checkins', 'goals', 'competitions', 'team_social', 'growth', 'wearables', 'activity_imports', 'soccer_training', 'skill_assessments', 'rollups']
     for filename in data_files:
-        if not os.path.exists(os.path.join(DATA_DIR, f'{filename}.json')):
+        if not storage.exists(filename):
             save_data(filename, {})
 
 if __name__ == '__main__':
@@ -0,0 +1,133 @@
+import hashlib
+import mimetypes
+import os
+import re
+import shutil
+
+from flask import request, send_from_directory
+
+import jsoncodec
+from compression import ENCODINGS, compress_body
+from storage import atomic_write_json
+
+ASSET_EXTENSIONS = ('.css', '.js')
+BUILD_DIR = 'dist'
+MANIFEST = 'manifest.json'
+HASH_LENGTH = 12
+# Fingerprinted URLs never change content, so clients may keep them a year
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+CSS_STRING = r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\''
+# Each pattern matches strings first, so their contents are never touched
+CSS_COMMENTS = re.compile('(' + CSS_STRING + r')|/\*.*?\*/', re.S)
+# Spaces next to these never matter (a space before ':' can, e.g. "a :hover")
+CSS_SPACES = re.compile('(' + CSS_STRING + r')|\s*;?\s*(})\s*|\s*([{;,>])\s*|(:)\s+|\s+')
+
+
+def minify_css(text):
+    text = CSS_COMMENTS.sub(lambda m: m.group(1) or '', text)
+    return CSS_SPACES.sub(lambda m: next((part for part in m.groups() if part), ' '), text).strip()
+
+
+def minify_js(text):
+    # Whitespace only: indentation and blank lines. Anything cleverer needs a
+    # real parser (regex literals, ASI), so leave it to the browser.
+    lines = (line.strip() for line in text.splitlines())
+    return '\n'.join(line for line in lines if line)
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+def iter_sources(static_dir):
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != os.path.join(static_dir, BUILD_DIR))
+        for name in sorted(files):
+            if name.endswith(ASSET_EXTENSIONS):
+                yield os.path.relpath(os.path.join(root, name), static_dir).replace(os.sep, '/')
+
+
+def build_assets(static_dir):
+    # Minify and fingerprint static/*.css|js into static/dist, each with
+    # precompressed copies, and record the mapping in static/dist/manifest.json
+    build_dir = os.path.join(static_dir, BUILD_DIR)
+    shutil.rmtree(build_dir, ignore_errors=True)
+    manifest = {}
+    for filename in iter_sources(static_dir):
+        base, ext = os.path.splitext(filename)
+        with open(os.path.join(static_dir, filename), 'r', encoding='utf-8') as f:
+            data = MINIFIERS[ext](f.read()).encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+        built = f'{BUILD_DIR}/{base}.{digest}{ext}'
+        path = os.path.join(static_dir, built)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        for encoding in ENCODINGS:
+            with open(path + ENCODING_SUFFIXES[encoding], 'wb') as f:
+                f.write(compress_body(data, encoding))
+        manifest[filename] = built
+    atomic_write_json(os.path.join(build_dir, MANIFEST), manifest)
+    return manifest
+
+
+# Serves static files and hands templates fingerprinted URLs: the built file
+# from the manifest, or (without a build) the source file with ?v=<hash>.
+# Either form gets a far-future immutable Cache-Control.
+class StaticAssets:
+    def __init__(self, static_dir):
+        self.static_dir = static_dir
+        self._hashes = {}
+        self.manifest = {}
+        self.encodings = {}
+        try:
+            with open(os.path.join(static_dir, BUILD_DIR, MANIFEST), 'rb') as f:
+                self.manifest = jsoncodec.load(f)
+        except (IOError, OSError, ValueError):
+            pass
+        for built in self.manifest.values():
+            path = os.path.join(static_dir, built)
+            self.encodings[built] = tuple(encoding for encoding in ENCODINGS
+                                          if os.path.exists(path + ENCODING_SUFFIXES[encoding]))
+
+    def source_hash(self, filename):
+        path = os.path.join(self.static_dir, filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = (stat.st_mtime_ns, stat.st_size)
+        cached = self._hashes.get(filename)
+        if cached is None or cached[0] != key:
+            with open(path, 'rb') as f:
+                cached = self._hashes[filename] = (key, hashlib.sha256(f.read()).hexdigest()[:HASH_LENGTH])
+        return cached[1]
+
+    def url(self, filename):
+        built = self.manifest.get(filename)
+        if built is not None:
+            return f'/static/{built}'
+        version = self.source_hash(filename)
+        return f'/static/{filename}?v={version}' if version else f'/static/{filename}'
+
+    def send(self, filename):
+        encodings = self.encodings.get(filename)
+        version = request.args.get('v')
+        immutable = encodings is not None or (version is not None and version == self.source_hash(filename))
+        if not immutable:
+            # Unversioned or stale URL: let the browser revalidate every time
+            return send_from_directory(self.static_dir, filename)
+
+        encoding = request.accept_encodings.best_match(encodings) if encodings else None
+        if encoding is None:
+            response = send_from_directory(self.static_dir, filename, max_age=IMMUTABLE_MAX_AGE)
+        else:
+            response = send_from_directory(self.static_dir, filename + ENCODING_SUFFIXES[encoding],
+                                           mimetype=mimetypes.guess_type(filename)[0], max_age=IMMUTABLE_MAX_AGE)
+            response.headers['Content-Encoding'] = encoding
+        if encodings:
+            response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
@@ -0,0 +1,63 @@
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import date
+import threading
+
+
+# One family's competitions in date order. Dates are ISO strings, so they sort
+# and compare as text; queries bisect into them and copy only what they return.
+class EventCalendar:
+    def __init__(self, events):
+        self.events = sorted((e for e in events.values() if isinstance(e, dict) and e.get('date')),
+                             key=lambda e: (e['date'], str(e.get('id', ''))))
+        self.dates = [e['date'] for e in self.events]
+
+    def __len__(self):
+        return len(self.events)
+
+    def between(self, start=None, end=None, limit=None, today=None):
+        # Inclusive ISO date range; either end may be open
+        lo = bisect_left(self.dates, str(start)) if start is not None else 0
+        hi = bisect_right(self.dates, str(end)) if end is not None else len(self.dates)
+        if limit is not None:
+            hi = min(hi, lo + limit)
+        today = today or date.today()
+        # Events hold only flat values, so a shallow copy keeps the index intact
+        return [dict(event, days_until=(date.fromisoformat(event['date']) - today).days)
+                for event in self.events[lo:hi]]
+
+    def upcoming(self, limit, today=None):
+        today = today or date.today()
+        return self.between(today, None, limit, today)
+
+
+# Built calendars per family, rebuilt when the storage version moves
+class CalendarCache:
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, storage, collection, family_id, shared_key=None):
+        # shared_key: an entry whose events every family's calendar includes
+        key = (collection, family_id)
+        version = (storage.user_version(collection, family_id),
+                   storage.user_version(collection, shared_key) if shared_key else 0)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        events = storage.load_user(collection, family_id)
+        if shared_key:
+            shared = storage.load_user(collection, shared_key)
+            shared.update(events)
+            events = shared
+        events = EventCalendar(events)
+        with self._lock:
+            self._entries[key] = (version, events)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return events
@@ -0,0 +1,46 @@
+import multiprocessing
+import os
+
+# gunicorn settings for PAMS (gunicorn also picks this file up on its own when
+# started from the project directory). Every value can be overridden from the
+# environment.
+#
+# The default profile is gthread: each worker serves PAMS_THREADS requests at
+# once, so a request waiting on a storage read, a SQLite lock or a password
+# hash ties up one thread instead of a whole worker, and dashboard polls keep
+# flowing. PAMS_WORKER_CLASS=sync restores one request per worker.
+#
+# gevent/eventlet are not supported: the JSON backend's fcntl.flock and
+# sqlite3 calls block the whole event loop, and two greenlets contending for
+# one collection lock would deadlock the worker.
+
+cores = multiprocessing.cpu_count()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5001')}"
+worker_class = os.environ.get('PAMS_WORKER_CLASS', 'gthread')
+if worker_class == 'gthread':
+    # Threads cover the waiting, so roughly one process per core is enough
+    workers = int(os.environ.get('WEB_CONCURRENCY', cores + 1))
+    threads = int(os.environ.get('PAMS_THREADS', 8))
+else:
+    workers = int(os.environ.get('WEB_CONCURRENCY', cores * 2 + 1))
+    threads = 1
+
+# Import the app once in the master: startup work (journal recovery, template
+# compilation) runs once and workers share those pages copy-on-write. Storage,
+# session, rate-limit and hashing pools all reconnect per process after fork.
+preload_app = os.environ.get('PAMS_PRELOAD', 'true').lower() == 'true'
+
+timeout = int(os.environ.get('PAMS_TIMEOUT', 30))
+graceful_timeout = 30
+# Polling dashboards reuse their connection between requests
+keepalive = 5
+
+# Recycle workers now and then so slow leaks can't accumulate; the jitter
+# keeps them from all restarting at once
+max_requests = int(os.environ.get('PAMS_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+
+# Heartbeat files on tmpfs, so a slow container disk can't make healthy workers look hung
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
@@ -0,0 +1,145 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from limits.storage import MovingWindowSupport, Storage
+
+# Fraction of writes that also sweep expired counters and window entries
+PURGE_PROBABILITY = 0.01
+
+
+def storage_uri(data_dir):
+    return 'sqlite:///' + os.path.join(data_dir, 'ratelimit.db')
+
+
+# Rate-limit state in a local SQLite file, so every gunicorn worker on the
+# host shares the same counters. Importing this module registers the
+# sqlite:// scheme with limits, e.g. storage_uri='sqlite:///data/ratelimit.db'
+# (relative to the working directory) or 'sqlite:////var/lib/pams/ratelimit.db'.
+class SQLiteLimiterStorage(Storage, MovingWindowSupport):
+    STORAGE_SCHEME = ['sqlite']
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS counters (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL,
+            expires REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS window_entries (
+            key TEXT NOT NULL,
+            atime REAL NOT NULL,
+            expires REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS window_entries_key ON window_entries (key, atime);
+        CREATE INDEX IF NOT EXISTS window_entries_expires ON window_entries (expires);
+    '''
+
+    def __init__(self, uri=None, wrap_exceptions=False, **options):
+        # As in SQLAlchemy: sqlite:///relative/path.db, sqlite:////absolute/path.db
+        path = uri[len('sqlite:///'):] if uri and uri.startswith('sqlite:///') else ''
+        self.db_path = path or os.path.join('data', 'ratelimit.db')
+        self._local = threading.local()
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _connect(self):
+        # One connection per thread and per process (gunicorn forks workers)
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(self.SCHEMA)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _maybe_purge(self, conn, now):
+        if random.random() < PURGE_PROBABILITY:
+            conn.execute('DELETE FROM counters WHERE expires <= ?', (now,))
+            conn.execute('DELETE FROM window_entries WHERE expires <= ?', (now,))
+
+    # Fixed and sliding window strategies
+    def incr(self, key, expiry, amount=1):
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                'INSERT INTO counters (key, value, expires) VALUES (?, ?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET '
+                'value = CASE WHEN expires <= ? THEN excluded.value ELSE value + excluded.value END, '
+                'expires = CASE WHEN expires <= ? THEN excluded.expires ELSE expires END '
+                'RETURNING value', (key, amount, now + expiry, now, now)).fetchone()
+            self._maybe_purge(conn, now)
+        return row[0]
+
+    def get(self, key):
+        row = self._connect().execute('SELECT value FROM counters WHERE key = ? AND expires > ?',
+                                      (key, time.time())).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key):
+        now = time.time()
+        row = self._connect().execute('SELECT expires FROM counters WHERE key = ? AND expires > ?',
+                                      (key, now)).fetchone()
+        return row[0] if row else now
+
+    def check(self):
+        try:
+            self._connect().execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        with self._transaction() as conn:
+            cleared = conn.execute('DELETE FROM counters').rowcount
+            cleared += conn.execute('DELETE FROM window_entries').rowcount
+        return cleared
+
+    def clear(self, key):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM counters WHERE key = ?', (key,))
+            conn.execute('DELETE FROM window_entries WHERE key = ?', (key,))
+
+    # Moving window: one row per hit, counted over the trailing expiry seconds
+    def acquire_entry(self, key, limit, expiry, amount=1):
+        if amount > limit:
+            return False
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM window_entries WHERE key = ? AND atime <= ?', (key, now - expiry))
+            count = conn.execute('SELECT COUNT(*) FROM window_entries WHERE key = ?', (key,)).fetchone()[0]
+            if count + amount > limit:
+                return False
+            conn.executemany('INSERT INTO window_entries (key, atime, expires) VALUES (?, ?, ?)',
+                             [(key, now, now + expiry)] * amount)
+            self._maybe_purge(conn, now)
+        return True
+
+    def get_moving_window(self, key, limit, expiry):
+        now = time.time()
+        oldest, count = self._connect().execute(
+            'SELECT MIN(atime), COUNT(*) FROM window_entries WHERE key = ? AND atime > ?',
+            (key, now - expiry)).fetchone()
+        return (oldest if count else now), count
@@ -0,0 +1,226 @@
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency bucket upper bounds in seconds (Prometheus client defaults)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Seconds between a worker's flushes of its pending samples
+FLUSH_INTERVAL = 10
+
+# Every metric /metrics reports: name -> (type, help)
+METRICS = {
+    'pams_http_requests_total': ('counter', 'HTTP requests by route, method and status.'),
+    'pams_http_request_duration_seconds': ('histogram', 'HTTP request latency by route and method.'),
+    'pams_ratelimit_rejections_total': ('counter', 'Requests rejected by the rate limiter, by route.'),
+    'pams_storage_operations_total': ('counter', 'Storage load/save calls by collection.'),
+    'pams_storage_operation_duration_seconds': ('histogram', 'Storage load/save latency by collection.'),
+    'pams_storage_bytes_read_total': ('counter', 'Bytes read from storage by collection.'),
+    'pams_storage_bytes_written_total': ('counter', 'Bytes written to storage by collection.'),
+    'pams_cache_hits_total': ('counter', 'In-process cache hits.'),
+    'pams_cache_misses_total': ('counter', 'In-process cache misses.'),
+    'pams_cache_hit_ratio': ('gauge', 'Cache hits over lookups since the metrics database was created.'),
+}
+
+
+def _number(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+BUCKET_LABELS = tuple(_number(bound) for bound in BUCKETS) + ('+Inf',)
+
+
+def _bucket(value):
+    return next((label for bound, label in zip(BUCKETS, BUCKET_LABELS) if value <= bound), '+Inf')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    return ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+
+
+def _sample(name, labels, value):
+    return f'{name}{{{labels}}} {_number(value)}' if labels else f'{name} {_number(value)}'
+
+
+# Request and storage metrics shared by every gunicorn worker on the host.
+# Each worker adds to in-memory deltas (one dict update under a lock per
+# sample) and a background thread folds them into a SQLite file every
+# FLUSH_INTERVAL seconds, so /metrics reports the sum over all workers no
+# matter which one answers the scrape. Histogram buckets are stored
+# per-bucket and made cumulative when rendered.
+class Metrics:
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS metrics (
+            name TEXT NOT NULL,
+            labels TEXT NOT NULL,
+            le TEXT NOT NULL,
+            value REAL NOT NULL,
+            PRIMARY KEY (name, labels, le)
+        );
+    '''
+
+    def __init__(self, db_path, flush_interval=FLUSH_INTERVAL):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._caches = []
+        self._pid = None
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connect()
+        atexit.register(self.flush)
+
+    def _connect(self):
+        # One connection per thread and per process (gunicorn forks workers)
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(self.SCHEMA)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _check_pid(self):
+        # Called with self._lock held. A forked worker drops the deltas it
+        # inherited (the parent still owns them), counts caches from their
+        # current values and starts its own flusher.
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._pending = {}
+        for cache in self._caches:
+            cache[2:] = self._cache_counts(cache[1])
+        threading.Thread(target=self._flush_loop, name='pams-metrics', daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def _add(self, key, amount):
+        self._pending[key] = self._pending.get(key, 0) + amount
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, _labels(labels), '')
+        with self._lock:
+            self._check_pid()
+            self._add(key, amount)
+
+    def observe(self, name, value, **labels):
+        labels = _labels(labels)
+        bucket = _bucket(value)
+        with self._lock:
+            self._check_pid()
+            self._add((name, labels, bucket), 1)
+            self._add((name, labels, 'sum'), value)
+
+    # Storage backends report through these (see storage.observer)
+    def storage_call(self, op, collection, seconds):
+        labels = _labels({'op': op, 'collection': collection})
+        bucket = _bucket(seconds)
+        with self._lock:
+            self._check_pid()
+            self._add(('pams_storage_operations_total', labels, ''), 1)
+            self._add(('pams_storage_operation_duration_seconds', labels, bucket), 1)
+            self._add(('pams_storage_operation_duration_seconds', labels, 'sum'), seconds)
+
+    def storage_bytes(self, direction, collection, nbytes):
+        if nbytes:
+            self.inc(f'pams_storage_bytes_{direction}_total', nbytes, collection=collection)
+
+    def _cache_counts(self, stats_fn):
+        stats = stats_fn() or {}
+        return [stats.get('hits', 0), stats.get('misses', 0)]
+
+    def track_cache(self, name, stats_fn):
+        # stats_fn returns a dict with running 'hits' and 'misses' totals (or
+        # None for a backend without a cache); the growth since the last flush
+        # is added to the shared counters
+        if stats_fn() is None:
+            return
+        with self._lock:
+            self._caches.append([name, stats_fn] + self._cache_counts(stats_fn))
+
+    def _collect_caches(self):
+        for cache in self._caches:
+            hits, misses = self._cache_counts(cache[1])
+            labels = _labels({'cache': cache[0]})
+            if hits > cache[2]:
+                self._add(('pams_cache_hits_total', labels, ''), hits - cache[2])
+            if misses > cache[3]:
+                self._add(('pams_cache_misses_total', labels, ''), misses - cache[3])
+            cache[2:] = [hits, misses]
+
+    def flush(self):
+        with self._lock:
+            self._check_pid()
+            self._collect_caches()
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            with self._transaction() as conn:
+                conn.executemany(
+                    'INSERT INTO metrics (name, labels, le, value) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT (name, labels, le) DO UPDATE SET value = value + excluded.value',
+                    [key + (value,) for key, value in pending.items()])
+        except sqlite3.Error:
+            # Keep the samples for the next flush rather than lose them
+            with self._lock:
+                for key, value in pending.items():
+                    self._add(key, value)
+
+    def render(self):
+        # Prometheus text exposition format, version 0.0.4
+        self.flush()
+        series = {}
+        for name, labels, le, value in self._connect().execute('SELECT name, labels, le, value FROM metrics'):
+            series.setdefault(name, {}).setdefault(labels, {})[le] = value
+
+        lines = []
+        for name, (kind, text) in METRICS.items():
+            lines.append(f'# HELP {name} {text}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == 'histogram':
+                for labels, values in sorted(series.get(name, {}).items()):
+                    count = 0
+                    for bucket in BUCKET_LABELS:
+                        count += values.get(bucket, 0)
+                        le = f'le="{bucket}"'
+                        lines.append(_sample(f'{name}_bucket', f'{labels},{le}' if labels else le, count))
+                    lines.append(_sample(f'{name}_sum', labels, values.get('sum', 0)))
+                    lines.append(_sample(f'{name}_count', labels, count))
+            elif name == 'pams_cache_hit_ratio':
+                hits = series.get('pams_cache_hits_total', {})
+                misses = series.get('pams_cache_misses_total', {})
+                for labels in sorted(set(hits) | set(misses)):
+                    hit = hits.get(labels, {}).get('', 0)
+                    total = hit + misses.get(labels, {}).get('', 0)
+                    lines.append(_sample(name, labels, round(hit / total, 4) if total else 0))
+            else:
+                for labels, values in sorted(series.get(name, {}).items()):
+                    lines.append(_sample(name, labels, values.get('', 0)))
+        return '\n'.join(lines) + '\n'
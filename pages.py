@@ -0,0 +1,53 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+# Rendered HTML per worker, keyed by everything a page is built from (template,
+# release, storage versions), so entries never need invalidating: a changed
+# input is a new key and the old entry ages out of the LRU.
+class RenderCache:
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, render):
+        # Returns (html, etag)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        html = render()
+        entry = (html, hashlib.sha1(html.encode('utf-8')).hexdigest())
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 3) if total else 0.0,
+                'entries': len(self._entries)
+            }
+
+
+def compile_templates(jinja_env):
+    # Parse and compile every template up front, so no request pays for it and
+    # a broken template fails at startup rather than on first visit
+    names = jinja_env.list_templates(extensions=('html',))
+    for name in names:
+        jinja_env.get_template(name)
+    return len(names)
@@ -0,0 +1,75 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# Full method string, so a stored hash made with other parameters is spotted
+# and upgraded on the user's next login
+HASH_METHOD = 'pbkdf2:sha256:600000'
+HASH_TIMEOUT = 10  # seconds a request waits for its hash before giving up
+
+
+class HasherBusy(Exception):
+    pass
+
+
+# Password hashing off the request thread, in a small process pool. At most
+# max_pending hashes may be queued or running; past that callers get
+# HasherBusy straight away instead of waiting behind a login burst.
+# workers=0 hashes inline (development, tests).
+class PasswordHasher:
+    def __init__(self, workers=2, max_pending=8, method=HASH_METHOD, timeout=HASH_TIMEOUT):
+        self.workers = workers
+        self.method = method
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_pid = None
+
+    def _executor(self):
+        # Created on first use in each process, so forked gunicorn workers
+        # never share a parent's pool
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy()
+        if not self.workers:
+            try:
+                return fn(*args)
+            finally:
+                self._slots.release()
+        try:
+            future = self._executor().submit(fn, *args)
+        except (BrokenProcessPool, RuntimeError):
+            self._slots.release()
+            with self._lock:
+                self._pool = None
+            raise HasherBusy()
+        # The slot is held until the hash finishes, even if this request gave up on it
+        future.add_done_callback(lambda f: self._slots.release())
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            raise HasherBusy()
+        except BrokenProcessPool:
+            with self._lock:
+                self._pool = None
+            raise HasherBusy()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, stored_hash, password):
+        return self._run(check_password_hash, stored_hash, password)
+
+    def needs_rehash(self, stored_hash):
+        return stored_hash.split('$', 1)[0] != self.method
@@ -0,0 +1,123 @@
+from bisect import bisect_left
+import math
+
+from timeseries import TimeSeries
+
+# Rolling windows kept per user, counted in records like the analytics routes
+ROLLUP_WINDOWS = (7, 14, 30)
+
+# Fields aggregated per collection; missing values count as 0
+ROLLUP_FIELDS = {
+    'checkins': ('sleep_hours', 'mood', 'water_bottles', 'training_completed', 'homework_done'),
+    'activity_imports': ('steps', 'active_minutes', 'calories'),
+}
+
+
+def record_values(collection, record):
+    values = {}
+    for field in ROLLUP_FIELDS[collection]:
+        value = record.get(field)
+        if isinstance(value, bool):
+            value = 1.0 if value else 0.0
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            value = 0.0
+        values[field] = 0.0 if math.isnan(value) else value
+
+    # Derived columns for the conditional stats in sleep_analysis and activity stats
+    if collection == 'checkins':
+        good_sleep = values['sleep_hours'] >= 8
+        values['good_sleep'] = 1.0 if good_sleep else 0.0
+        values['good_sleep_mood'] = values['mood'] if good_sleep else 0.0
+        values['sleep_x_mood'] = values['sleep_hours'] * values['mood']
+    elif collection == 'activity_imports':
+        values['step_goal'] = 1.0 if values['steps'] >= 10000 else 0.0
+        values['activity_goal'] = 1.0 if values['active_minutes'] >= 60 else 0.0
+    return values
+
+
+def _empty():
+    return {'count': 0, 'sum': {}, 'sumsq': {}, 'min': {}, 'max': {}}
+
+
+def _add(agg, values):
+    agg['count'] += 1
+    for field, value in values.items():
+        agg['sum'][field] = agg['sum'].get(field, 0.0) + value
+        agg['sumsq'][field] = agg['sumsq'].get(field, 0.0) + value * value
+        agg['min'][field] = min(agg['min'].get(field, value), value)
+        agg['max'][field] = max(agg['max'].get(field, value), value)
+
+
+def _remove(agg, values):
+    # Returns True when a removed value was an extreme, so min/max need a rescan
+    agg['count'] -= 1
+    stale = False
+    for field, value in values.items():
+        agg['sum'][field] -= value
+        agg['sumsq'][field] -= value * value
+        if value <= agg['min'][field] or value >= agg['max'][field]:
+            stale = True
+    return stale
+
+
+# Materialised count/sum/sum-of-squares/min/max over a user's most recent
+# records. Keeps the last max(ROLLUP_WINDOWS) records so a write can update
+# each window by adding the new record and removing the one it displaces.
+class Rollup:
+    def __init__(self, collection, state=None):
+        state = state or {}
+        self.collection = collection
+        self.recent = [tuple(item) for item in state.get('recent', [])]  # (date, values), oldest first
+        self.windows = state.get('windows') or {str(w): _empty() for w in ROLLUP_WINDOWS}
+
+    @classmethod
+    def build(cls, collection, records):
+        rollup = cls(collection)
+        series_dates = TimeSeries(records, ()).dates[-max(ROLLUP_WINDOWS):]
+        for key in series_dates:
+            rollup.apply(key, records[key])
+        return rollup
+
+    def to_dict(self):
+        return {'recent': [list(item) for item in self.recent], 'windows': self.windows}
+
+    def window(self, size):
+        return self.windows[str(size)]
+
+    def apply(self, key, record):
+        values = record_values(self.collection, record)
+        before = dict(self.recent)
+        old_dates = [d for d, _ in self.recent]
+
+        index = bisect_left(old_dates, key)
+        if index < len(old_dates) and old_dates[index] == key:
+            self.recent[index] = (key, values)
+        else:
+            self.recent.insert(index, (key, values))
+        self.recent = self.recent[-max(ROLLUP_WINDOWS):]
+        after = dict(self.recent)
+        new_dates = [d for d, _ in self.recent]
+
+        for size in ROLLUP_WINDOWS:
+            agg = self.windows[str(size)]
+            old_members = set(old_dates[-size:])
+            new_members = set(new_dates[-size:])
+            stale = False
+            for d in old_members - new_members:
+                stale |= _remove(agg, before[d])
+            if key in old_members and key in new_members:
+                stale |= _remove(agg, before[key])
+                _add(agg, after[key])
+            for d in new_members - old_members:
+                _add(agg, after[d])
+            if stale:
+                self._rescan_extremes(agg, new_dates[-size:], after)
+
+    def _rescan_extremes(self, agg, dates, values_by_date):
+        agg['min'], agg['max'] = {}, {}
+        for d in dates:
+            for field, value in values_by_date[d].items():
+                agg['min'][field] = min(agg['min'].get(field, value), value)
+                agg['max'][field] = max(agg['max'].get(field, value), value)
@@ -0,0 +1,169 @@
+import os
+import random
+import secrets
+import sqlite3
+import threading
+import time
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+import jsoncodec
+from storage import atomic_write_json
+
+# Fraction of session writes that also sweep out expired sessions
+PURGE_PROBABILITY = 0.01
+
+
+# Session contents live server-side; the cookie only carries a random id
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid or secrets.token_urlsafe(32)
+        self.new = new
+        self.modified = False
+        self.stale_sid = None
+
+    def regenerate(self):
+        # New id after login so a session id fixed before login is useless
+        if not self.new:
+            self.stale_sid = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.modified = True
+
+
+class SQLiteSessionStore:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connect()
+
+    def _connect(self):
+        # One connection per thread and per process (gunicorn forks workers)
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS sessions '
+                     '(sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL)')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def get(self, sid):
+        row = self._connect().execute('SELECT data FROM sessions WHERE sid = ? AND expires > ?',
+                                      (sid, time.time())).fetchone()
+        return jsoncodec.loads(row[0]) if row else None
+
+    def set(self, sid, data, expires):
+        conn = self._connect()
+        conn.execute('INSERT INTO sessions (sid, data, expires) VALUES (?, ?, ?) '
+                     'ON CONFLICT (sid) DO UPDATE SET data = excluded.data, expires = excluded.expires',
+                     (sid, jsoncodec.dumps(data), expires))
+        if random.random() < PURGE_PROBABILITY:
+            conn.execute('DELETE FROM sessions WHERE expires <= ?', (time.time(),))
+
+    def delete(self, sid):
+        self._connect().execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+
+class FileSessionStore:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, sid):
+        # Ids come from the cookie, so only token_urlsafe characters are allowed
+        if not sid or not sid.replace('_', '').replace('-', '').isalnum():
+            return None
+        return os.path.join(self.directory, f'{sid}.json')
+
+    def get(self, sid):
+        path = self.path(sid)
+        if path is None:
+            return None
+        try:
+            with open(path, 'r') as f:
+                entry = jsoncodec.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if entry.get('expires', 0) <= time.time():
+            return None
+        return entry.get('data')
+
+    def set(self, sid, data, expires):
+        atomic_write_json(self.path(sid), {'data': data, 'expires': expires})
+        if random.random() < PURGE_PROBABILITY:
+            self.purge()
+
+    def delete(self, sid):
+        path = self.path(sid)
+        if path is not None and os.path.exists(path):
+            os.unlink(path)
+
+    def purge(self):
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, 'r') as f:
+                    expired = jsoncodec.load(f).get('expires', 0) <= now
+                if expired:
+                    os.unlink(path)
+            except (IOError, OSError, ValueError):
+                continue
+
+
+class ServerSessionInterface(SessionInterface):
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            data = self.store.get(sid)
+            if data is not None:
+                return ServerSession(data, sid=sid)
+        return ServerSession(new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.stale_sid:
+            self.store.delete(session.stale_sid)
+        if not session:
+            # Cleared (logout): drop the stored copy and the cookie
+            if session.modified:
+                if not session.new:
+                    self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        if not self.should_set_cookie(app, session):
+            return
+
+        # Browser-session cookies still need a server-side expiry
+        expires = self.get_expiration_time(app, session)
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        self.store.set(session.sid, dict(session), expires.timestamp() if expires else time.time() + lifetime)
+        response.set_cookie(name, session.sid, expires=expires, httponly=self.get_cookie_httponly(app),
+                            domain=domain, path=path, secure=self.get_cookie_secure(app),
+                            samesite=self.get_cookie_samesite(app))
+
+
+def create_session_interface(backend, path):
+    if backend == 'sqlite':
+        return ServerSessionInterface(SQLiteSessionStore(path))
+    if backend == 'filesystem':
+        return ServerSessionInterface(FileSessionStore(path))
+    raise ValueError(f"Unknown session store: {backend}")
@@ -0,0 +1,981 @@
+import heapq
+import logging
+import os
+import sqlite3
+import stat
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+import jsoncodec
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines; locking becomes a no-op
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+# Collections kept in a single file: users is looked up across families
+UNSHARDED_COLLECTIONS = ('users',)
+# Shard for keys that belong to no family (e.g. date-keyed legacy collections)
+SHARED_SHARD = '_shared'
+# Directories in the data dir that hold something other than collection
+# shards (data/sessions is the default filesystem session store)
+RESERVED_DIRS = ('sessions',)
+
+
+def _is_safe_name(name):
+    return isinstance(name, str) and name.replace('_', '').replace('-', '').isalnum()
+
+
+def validate_collection(name):
+    # Validate collection name to prevent path traversal
+    if not _is_safe_name(name):
+        raise ValueError("Invalid filename")
+    return os.path.basename(name)
+
+
+def _is_record_map(value):
+    # Per-user collections map record keys (dates, post ids) to record dicts
+    return isinstance(value, dict) and all(isinstance(v, dict) for v in value.values())
+
+
+def _copy(value):
+    # Copy-on-read for JSON-shaped data; cheaper than copy.deepcopy
+    if type(value) is dict:
+        return {k: _copy(v) for k, v in value.items()}
+    if type(value) is list:
+        return [_copy(v) for v in value]
+    return value
+
+
+def _timed(op):
+    # Reports each call's duration to the backend's observer, if one is set
+    # (see metrics.py). Only outermost public methods are wrapped, so nested
+    # calls aren't counted twice.
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, collection, *args, **kwargs):
+            observer = self.observer
+            if observer is None:
+                return method(self, collection, *args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return method(self, collection, *args, **kwargs)
+            finally:
+                observer.storage_call(op, collection, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def _order_value(record, order_field):
+    return str(record.get(order_field, '')) if order_field else ''
+
+
+def page_items(items, limit, before=None, order_field=None):
+    # Newest-first (sort key, record) pairs from (key, record) items, ordered by
+    # (record[order_field], key) or by key alone; only strictly before `before`
+    candidates = (((_order_value(record, order_field), key), record)
+                  for key, record in items if isinstance(record, dict))
+    if before is not None:
+        before = tuple(before)
+        candidates = (c for c in candidates if c[0] < before)
+    return heapq.nlargest(limit, candidates, key=lambda c: c[0])
+
+
+# Process-local cache of parsed collections, validated against a file stamp
+class ReadCache:
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, stamp):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == stamp:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, key, stamp, value):
+        with self._lock:
+            self._entries[key] = (stamp, value)
+
+    def peek(self, key):
+        # Last entry regardless of stamp, without touching the counters
+        with self._lock:
+            return self._entries.get(key)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 3) if total else 0.0,
+                'entries': len(self._entries)
+            }
+
+
+# Cross-process exclusive locks, one lock file per collection. Re-entrant
+# within a thread so a locked handler can still call save_user/put_record.
+class CollectionLocks:
+    def __init__(self, lock_dir):
+        self.lock_dir = lock_dir
+        self._held = threading.local()
+
+    @contextmanager
+    def lock(self, collection, shard=None):
+        # One lock per collection, or per shard of a sharded collection
+        collection = validate_collection(collection)
+        if shard is None:
+            key, path = collection, os.path.join(self.lock_dir, f'.{collection}.lock')
+        else:
+            key = (collection, validate_collection(shard))
+            os.makedirs(os.path.join(self.lock_dir, collection), exist_ok=True)
+            path = os.path.join(self.lock_dir, collection, f'.{shard}.lock')
+        held = self._held.__dict__.setdefault('locks', {})
+        if key in held:
+            held[key][1] += 1
+            try:
+                yield
+            finally:
+                held[key][1] -= 1
+            return
+
+        f = open(path, 'a')
+        try:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            held[key] = [f, 1]
+            try:
+                yield
+            finally:
+                del held[key]
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+        finally:
+            f.close()
+
+
+def atomic_write_json(path, data):
+    # Write to a temp file in the same directory, fsync, then rename over the
+    # target so readers never see a partially written file
+    directory = os.path.dirname(path) or '.'
+    payload = jsoncodec.dumps_bytes(data)
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except OSError:
+        mode = 0o644
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            # mkstemp creates 0600; keep the file readable as before (e.g. a
+            # manifest built by one user and served by another)
+            if hasattr(os, 'fchmod'):
+                os.fchmod(f.fileno(), mode)
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    if hasattr(os, 'O_DIRECTORY'):
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    return len(payload)
+
+
+# Secondary indexes over the users collection (email, child name + PIN,
+# family). Derived from one parsed snapshot and rebuilt when it changes.
+class UserIndex:
+    def __init__(self, users):
+        self.source = users
+        self.by_email = {}
+        self.children = {}
+        self.families = {}
+        for user_id, user in users.items():
+            if not isinstance(user, dict):
+                continue
+            email = user.get('email')
+            if email:
+                self.by_email.setdefault(email.lower(), user_id)
+            if user.get('role') == 'child' and user.get('pin'):
+                self.children.setdefault((user.get('name', '').lower(), user['pin']), user_id)
+            if user.get('family_id'):
+                self.families.setdefault(user['family_id'], []).append(user_id)
+
+
+# JSON directory backend. users is one data/users.json file; every other
+# collection is sharded by family, one data/<collection>/<family_id>.json file
+# per family (keys that belong to no family share data/<collection>/_shared.json),
+# so a write only touches, locks and re-reads its own family's file.
+# Small writes append to a .jsonl journal next to each file; readers replay the
+# journal over the snapshot and a background thread periodically folds it back in.
+# Collections still in the old one-file layout keep working until resharded.
+class JSONStorage:
+    COMPACT_INTERVAL = 60  # seconds between background compaction passes
+    COMPACT_MIN_BYTES = 64 * 1024  # journals smaller than this are left alone
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.cache = ReadCache()
+        self.locks = CollectionLocks(data_dir)
+        self._compactor_pid = None
+        self._compactor_lock = threading.Lock()
+        self._user_index = None
+        self.observer = None
+        os.makedirs(data_dir, exist_ok=True)
+
+    def _count(self, direction, collection, nbytes):
+        if self.observer is not None:
+            self.observer.storage_bytes(direction, collection, nbytes)
+
+    def lock(self, collection, user_id=None):
+        # The whole collection, or just the shard holding user_id
+        if user_id is None:
+            return self.locks.lock(collection)
+        return self._locked_part(collection, user_id)
+
+    def path(self, collection, ext='json', shard=None):
+        collection = validate_collection(collection)
+        if shard is None:
+            path = os.path.join(self.data_dir, f'{collection}.{ext}')
+        else:
+            path = os.path.join(self.data_dir, collection, f'{validate_collection(shard)}.{ext}')
+
+        # Ensure path is within data_dir
+        real_data_dir = os.path.realpath(self.data_dir)
+        real_path = os.path.realpath(path)
+        if not real_path.startswith(real_data_dir):
+            raise ValueError("Path traversal attempt detected")
+        return path
+
+    def journal_path(self, collection, shard=None):
+        return self.path(collection, 'jsonl', shard)
+
+    def shard_dir(self, collection):
+        return os.path.join(self.data_dir, validate_collection(collection))
+
+    def exists(self, collection):
+        return (os.path.exists(self.path(collection)) or os.path.exists(self.journal_path(collection))
+                or os.path.isdir(self.shard_dir(collection)))
+
+    def collections(self):
+        names = set()
+        for f in os.listdir(self.data_dir):
+            if f.startswith('.'):
+                continue
+            if f.endswith('.json'):
+                names.add(f[:-5])
+            elif f.endswith('.jsonl'):
+                names.add(f[:-6])
+            elif (f not in RESERVED_DIRS and os.path.isdir(os.path.join(self.data_dir, f))
+                  and self.shards(f)):
+                names.add(f)
+        return sorted(name for name in names if _is_safe_name(name))
+
+    def is_sharded(self, collection):
+        # A leftover one-file snapshot or journal means reshard hasn't run yet
+        return (collection not in UNSHARDED_COLLECTIONS and not os.path.exists(self.path(collection))
+                and not os.path.exists(self.journal_path(collection)))
+
+    def shards(self, collection):
+        try:
+            names = os.listdir(self.shard_dir(collection))
+        except OSError:
+            return []
+        return sorted({name.rsplit('.', 1)[0] for name in names
+                       if not name.startswith('.') and name.endswith(('.json', '.jsonl'))})
+
+    def shard_for(self, key):
+        # A user's records live with their family (or alone, for accounts
+        # without one); family-keyed entries (competitions) use the family itself
+        index = self.user_index()
+        user = index.source.get(key)
+        if isinstance(user, dict):
+            shard = user.get('family_id') or key
+        elif key in index.families:
+            shard = key
+        else:
+            return SHARED_SHARD
+        return shard if _is_safe_name(shard) else SHARED_SHARD
+
+    def _part(self, collection, key, sharded=None):
+        # (collection, shard) naming the file that holds key; shard None is the
+        # one-file layout
+        if sharded is None:
+            sharded = self.is_sharded(collection)
+        return (collection, self.shard_for(key) if sharded else None)
+
+    @contextmanager
+    def _locked_part(self, collection, key):
+        # Locks the file holding key, rechecking under the lock in case a
+        # reshard moved the collection meanwhile
+        while True:
+            part = self._part(collection, key)
+            with self.locks.lock(*part):
+                if self._part(collection, key) == part:
+                    yield part
+                    return
+
+    def _replay(self, journal_path, data, offset):
+        # Apply journal entries written after offset. Users touched here get a
+        # fresh dict so objects shared with an older cache entry stay untouched.
+        with open(journal_path, 'rb') as f:
+            f.seek(offset)
+            chunk = f.read()
+        end = chunk.rfind(b'\n') + 1  # a half-written last line is retried next time
+        copied = set()
+        for line in chunk[:end].splitlines():
+            try:
+                entry = jsoncodec.loads(line)
+            except ValueError:
+                continue  # torn line left by a crash mid-append
+            if 'u' in entry:
+                user_id = entry['u']
+                if user_id not in copied:
+                    user_data = data.get(user_id)
+                    data[user_id] = dict(user_data) if isinstance(user_data, dict) else {}
+                    copied.add(user_id)
+                data[user_id][entry['k']] = entry['v']
+            else:
+                data[entry['k']] = entry['v']
+                copied.add(entry['k'])
+        return data, offset + end
+
+    def _stamp(self, part):
+        try:
+            st = os.stat(self.path(part[0], shard=part[1]))
+            # A changed file always changes mtime, size or (after a replace) inode
+            snapshot_stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+        except OSError:
+            snapshot_stamp = None
+        try:
+            jst = os.stat(self.journal_path(*part))
+            journal_stamp = (jst.st_ino, jst.st_size)
+        except OSError:
+            journal_stamp = None
+        return snapshot_stamp, journal_stamp
+
+    def user_version(self, collection, user_id):
+        # Moves on any write to the file holding the user, i.e. their family's shard
+        return self._stamp(self._part(collection, user_id))
+
+    def collection_version(self, collection):
+        if not self.is_sharded(collection):
+            return self._stamp((collection, None))
+        return tuple((shard, self._stamp((collection, shard))) for shard in self.shards(collection))
+
+    def _read(self, part):
+        # Returns the shared cached object; callers must copy before handing out
+        while True:
+            stamp = self._stamp(part)
+            if stamp == (None, None):
+                return {}
+            cached = self.cache.get(part, stamp)
+            if cached is not None:
+                return cached[0]
+            data, offset = self._load_part(part, stamp)
+            # A compaction between the stat and the reads can pair an old
+            # snapshot with a journal that has since been folded in and
+            # removed; start over if either file was swapped meanwhile
+            after = self._stamp(part)
+            if after[0] == stamp[0] and (stamp[1] is None or (after[1] is not None and after[1][0] == stamp[1][0])):
+                self.cache.put(part, stamp, (data, offset))
+                return data
+
+    def _load_part(self, part, stamp):
+        snapshot_stamp, journal_stamp = stamp
+        previous = self.cache.peek(part)
+        if (previous is not None and journal_stamp is not None and previous[0][0] == snapshot_stamp
+                and previous[0][1] is not None and previous[0][1][0] == journal_stamp[0]):
+            # Same snapshot, journal only grew: replay just the new tail
+            data, offset = dict(previous[1][0]), previous[1][1]
+        else:
+            data, offset = {}, 0
+            if snapshot_stamp is not None:
+                path = self.path(part[0], shard=part[1])
+                try:
+                    with open(path, 'rb') as f:
+                        raw = f.read()
+                except (IOError, OSError):
+                    raw = None  # replaced or removed under us; _read retries
+                if raw is not None:
+                    try:
+                        data = jsoncodec.loads(raw)
+                    except ValueError:
+                        # Never treat an unreadable snapshot as empty: a write
+                        # or compaction would then replace it with {}
+                        raise ValueError(f"Corrupt data file: {path}")
+                    self._count('read', part[0], len(raw))
+        if journal_stamp is not None:
+            try:
+                start = offset
+                data, offset = self._replay(self.journal_path(*part), data, offset)
+                self._count('read', part[0], offset - start)
+            except (IOError, OSError):
+                pass
+        return data, offset
+
+    def _append(self, part, *entries):
+        # O(record) write: one fsynced line per entry in the file's journal
+        line = b''.join(jsoncodec.dumps_bytes(entry) + b'\n' for entry in entries)
+        try:
+            with open(self.journal_path(*part), 'a+b') as f:
+                size = f.tell()
+                if size and os.pread(f.fileno(), 1, size - 1) != b'\n':
+                    line = b'\n' + line  # don't glue onto a torn line
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+        except (IOError, OSError) as e:
+            raise ValueError(f"Failed to save data: {str(e)}")
+        self._count('written', part[0], len(line))
+        self._ensure_compactor()
+
+    def _write_part(self, part, data):
+        # Caller holds the part's lock. The snapshot now holds everything, so
+        # the journal must go.
+        self.cache.invalidate(part)
+        try:
+            written = atomic_write_json(self.path(part[0], shard=part[1]), data)
+            if os.path.exists(self.journal_path(*part)):
+                os.unlink(self.journal_path(*part))
+        except (IOError, OSError) as e:
+            raise ValueError(f"Failed to save data: {str(e)}")
+        self._count('written', part[0], written)
+
+    def _remove_part(self, part):
+        self.cache.invalidate(part)
+        for path in (self.path(part[0], shard=part[1]), self.journal_path(*part)):
+            if os.path.exists(path):
+                os.unlink(path)
+
+    def _write_shards(self, collection, data):
+        # Caller holds the collection lock. Regroups data by family and
+        # rewrites every shard, dropping shards left empty.
+        groups = {}
+        for key, value in data.items():
+            groups.setdefault(self.shard_for(key), {})[key] = value
+        os.makedirs(self.shard_dir(collection), exist_ok=True)
+        for shard in sorted(set(self.shards(collection)) | set(groups)):
+            with self.locks.lock(collection, shard):
+                if shard in groups:
+                    self._write_part((collection, shard), groups[shard])
+                else:
+                    self._remove_part((collection, shard))
+        return groups
+
+    @_timed('load')
+    def load(self, collection):
+        if not self.is_sharded(collection):
+            return _copy(self._read((collection, None)))
+        data = {}
+        for shard in self.shards(collection):
+            data.update(self._read((collection, shard)))
+        return _copy(data)
+
+    @_timed('save')
+    def save(self, collection, data):
+        with self.lock(collection):
+            if not self.is_sharded(collection) or not isinstance(data, dict):
+                self._write_part((collection, None), data)
+            else:
+                self._write_shards(collection, data)
+
+    @_timed('load')
+    def load_user(self, collection, user_id):
+        # Only the requested user's entry is copied out of the cache
+        return _copy(self._read(self._part(collection, user_id)).get(user_id, {}))
+
+    @_timed('load')
+    def load_users(self, collection, user_ids):
+        # Several users' entries, reading each family's shard once
+        sharded = self.is_sharded(collection)
+        return {user_id: _copy(self._read(self._part(collection, user_id, sharded)).get(user_id, {}))
+                for user_id in user_ids}
+
+    @_timed('load')
+    def load_page(self, collection, user_id, limit, before=None, order_field=None):
+        # Records are selected from the cached dict; only the page is copied
+        user_data = self._read(self._part(collection, user_id)).get(user_id)
+        if not isinstance(user_data, dict):
+            return []
+        return [(sort_key, _copy(record)) for sort_key, record in
+                page_items(user_data.items(), limit, before, order_field)]
+
+    @_timed('load')
+    def load_record(self, collection, user_id, key):
+        user_data = self._read(self._part(collection, user_id)).get(user_id)
+        if not isinstance(user_data, dict):
+            return {}
+        return _copy(user_data.get(key, {}))
+
+    def save_user(self, collection, user_id, data):
+        self.put(collection, user_id, data)
+
+    @_timed('save')
+    def put(self, collection, key, value):
+        # Set one top-level entry of a collection
+        with self._locked_part(collection, key) as part:
+            self._append(part, {'k': key, 'v': value})
+
+    @_timed('save')
+    def put_record(self, collection, user_id, key, record):
+        with self._locked_part(collection, user_id) as part:
+            self._append(part, {'u': user_id, 'k': key, 'v': record})
+
+    @_timed('save')
+    def put_records(self, collection, user_id, records):
+        # Many records for one user in a single append and fsync
+        if not records:
+            return
+        with self._locked_part(collection, user_id) as part:
+            self._append(part, *({'u': user_id, 'k': key, 'v': record} for key, record in records.items()))
+
+    def user_index(self):
+        # Any write to users yields a new cached object, which triggers a rebuild
+        users = self._read(('users', None))
+        index = self._user_index
+        if index is None or index.source is not users:
+            index = UserIndex(users)
+            self._user_index = index
+        return index
+
+    def find_user_by_email(self, email):
+        index = self.user_index()
+        user_id = index.by_email.get(email.lower())
+        return _copy(index.source[user_id]) if user_id else None
+
+    def find_child(self, name, pin):
+        index = self.user_index()
+        user_id = index.children.get((name.lower(), pin))
+        return _copy(index.source[user_id]) if user_id else None
+
+    def family_members(self, family_id):
+        index = self.user_index()
+        return [_copy(index.source[user_id]) for user_id in index.families.get(family_id, [])]
+
+    def reshard(self):
+        # Moves one-file collections into per-family shards and regroups
+        # existing shards by each key's current family. Run it with the app
+        # stopped: only the collection being moved is locked against writers.
+        resharded = {}
+        for collection in self.collections():
+            if collection in UNSHARDED_COLLECTIONS:
+                continue
+            with self.lock(collection):
+                flat = (collection, None)
+                data = self._read(flat)
+                if not isinstance(data, dict):
+                    continue  # not a keyed collection; it stays one file
+                data = dict(data)
+                for shard in self.shards(collection):
+                    data.update(self._read((collection, shard)))
+                groups = self._write_shards(collection, data)
+                self._remove_part(flat)
+            resharded[collection] = (len(data), len(groups))
+        return resharded
+
+    def compact(self, collection, min_bytes=0, shard=None):
+        # Fold a journal into its snapshot; replaying twice is harmless, so a
+        # crash between the snapshot write and the unlink loses nothing
+        part = (collection, shard)
+        journal_path = self.journal_path(*part)
+        # Checked before locking too, so idle shards don't get lock files
+        try:
+            if os.path.getsize(journal_path) < min_bytes:
+                return False
+        except OSError:
+            return False
+        with self.locks.lock(*part):
+            try:
+                if os.path.getsize(journal_path) < min_bytes:
+                    return False
+            except OSError:
+                return False
+            self._write_part(part, self._read(part))
+            return True
+
+    def _parts(self):
+        for collection in self.collections():
+            if self.is_sharded(collection):
+                for shard in self.shards(collection):
+                    yield collection, shard
+            else:
+                yield collection, None
+
+    def recover(self):
+        # Startup replay: fold journals left over from a previous run. A part
+        # whose snapshot won't parse is left alone, journal and all, for a
+        # person to look at.
+        recovered = []
+        for part in self._parts():
+            name = '/'.join(filter(None, part))
+            try:
+                if self.compact(part[0], shard=part[1]):
+                    recovered.append(name)
+            except ValueError as e:
+                logger.error('Skipped recovering %s: %s', name, e)
+        return recovered
+
+    def _ensure_compactor(self):
+        # Started lazily per process so forked gunicorn workers each get one;
+        # the lock keeps threaded workers from starting two
+        if self._compactor_pid == os.getpid():
+            return
+        with self._compactor_lock:
+            if self._compactor_pid == os.getpid():
+                return
+            self._compactor_pid = os.getpid()
+            threading.Thread(target=self._compact_loop, name='pams-compactor', daemon=True).start()
+
+    def _compact_loop(self):
+        while True:
+            time.sleep(self.COMPACT_INTERVAL)
+            try:
+                parts = list(self._parts())
+            except Exception:
+                logger.exception('Compactor could not list collections')
+                continue
+            for collection, shard in parts:
+                # A failing part (corrupt snapshot, a file gone mid-reshard)
+                # mustn't end the thread; nothing would ever restart it
+                try:
+                    self.compact(collection, self.COMPACT_MIN_BYTES, shard)
+                except Exception:
+                    logger.exception('Compacting %s failed', '/'.join(filter(None, (collection, shard))))
+
+    def cache_stats(self):
+        return self.cache.stats()
+
+    def close(self):
+        pass
+
+
+# SQLite backend: one row per (collection, user_id, date). For per-user
+# collections 'date' holds the record key (a date, or a post id for
+# team_social); values that aren't record maps are stored whole with date ''.
+class SQLiteStorage:
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS records (
+            collection TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            date TEXT NOT NULL,
+            value TEXT NOT NULL,
+            PRIMARY KEY (collection, user_id, date)
+        );
+        CREATE TABLE IF NOT EXISTS versions (
+            collection TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            PRIMARY KEY (collection, user_id)
+        );
+        CREATE INDEX IF NOT EXISTS users_email
+            ON records (lower(json_extract(value, '$.email'))) WHERE collection = 'users';
+        CREATE INDEX IF NOT EXISTS users_child_login
+            ON records (lower(json_extract(value, '$.name')), json_extract(value, '$.pin'))
+            WHERE collection = 'users';
+        CREATE INDEX IF NOT EXISTS users_family
+            ON records (json_extract(value, '$.family_id')) WHERE collection = 'users';
+    '''
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.locks = CollectionLocks(directory or '.')
+        self.observer = None
+        self._connect()
+
+    def _count(self, direction, collection, nbytes):
+        # Sizes are the stored JSON text lengths (bytes for ASCII data)
+        if self.observer is not None:
+            self.observer.storage_bytes(direction, collection, nbytes)
+
+    def lock(self, collection, user_id=None):
+        # Row writes are transactional; this guards read-modify-write sequences.
+        # Per-user writes already touch only that user's rows, so user_id
+        # doesn't narrow the lock here.
+        return self.locks.lock(collection)
+
+    def _connect(self):
+        # One connection per thread and per process (gunicorn forks workers)
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(self.SCHEMA)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            yield conn
+            conn.execute('COMMIT')
+        except BaseException as e:
+            # Any failure (e.g. a value json can't encode) must release the
+            # write lock, or this thread's next write finds a transaction open
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            if isinstance(e, sqlite3.Error):
+                raise ValueError(f"Failed to save data: {str(e)}")
+            raise
+
+    def _bump(self, conn, collection, user_id):
+        conn.execute(
+            'INSERT INTO versions (collection, user_id, version) VALUES (?, ?, 1) '
+            'ON CONFLICT (collection, user_id) DO UPDATE SET version = version + 1', (collection, user_id))
+
+    def _write_user(self, conn, collection, user_id, data):
+        self._bump(conn, collection, user_id)
+        conn.execute('DELETE FROM records WHERE collection = ? AND user_id = ?', (collection, user_id))
+        if _is_record_map(data):
+            rows = [(collection, user_id, key, jsoncodec.dumps(record)) for key, record in data.items()]
+        else:
+            rows = [(collection, user_id, '', jsoncodec.dumps(data))]
+        self._count('written', collection, sum(len(row[3]) for row in rows))
+        conn.executemany('INSERT INTO records (collection, user_id, date, value) VALUES (?, ?, ?, ?)', rows)
+
+    def _assemble(self, rows):
+        if len(rows) == 1 and rows[0][0] == '':
+            return jsoncodec.loads(rows[0][1])
+        return {key: jsoncodec.loads(value) for key, value in rows}
+
+    def exists(self, collection):
+        collection = validate_collection(collection)
+        row = self._connect().execute(
+            'SELECT 1 FROM records WHERE collection = ? LIMIT 1', (collection,)).fetchone()
+        return row is not None
+
+    def collections(self):
+        rows = self._connect().execute('SELECT DISTINCT collection FROM records ORDER BY collection')
+        return [row[0] for row in rows]
+
+    @_timed('load')
+    def load(self, collection):
+        collection = validate_collection(collection)
+        rows = self._connect().execute(
+            'SELECT user_id, date, value FROM records WHERE collection = ? ORDER BY rowid', (collection,))
+        grouped = {}
+        nbytes = 0
+        for user_id, key, value in rows:
+            grouped.setdefault(user_id, []).append((key, value))
+            nbytes += len(value)
+        self._count('read', collection, nbytes)
+        return {user_id: self._assemble(user_rows) for user_id, user_rows in grouped.items()}
+
+    @_timed('save')
+    def save(self, collection, data):
+        collection = validate_collection(collection)
+        with self._transaction() as conn:
+            # Users dropped from the collection must see a new version too
+            conn.execute('UPDATE versions SET version = version + 1 WHERE collection = ?', (collection,))
+            conn.execute('DELETE FROM records WHERE collection = ?', (collection,))
+            for user_id, value in data.items():
+                self._write_user(conn, collection, user_id, value)
+
+    @_timed('load')
+    def load_user(self, collection, user_id):
+        return self._load_user(collection, user_id)
+
+    def _load_user(self, collection, user_id):
+        collection = validate_collection(collection)
+        rows = self._connect().execute(
+            'SELECT date, value FROM records WHERE collection = ? AND user_id = ? ORDER BY rowid',
+            (collection, user_id)).fetchall()
+        if not rows:
+            return {}
+        self._count('read', collection, sum(len(value) for _, value in rows))
+        return self._assemble(rows)
+
+    @_timed('load')
+    def load_users(self, collection, user_ids):
+        collection = validate_collection(collection)
+        user_ids = list(user_ids)
+        grouped = {user_id: [] for user_id in user_ids}
+        if user_ids:
+            placeholders = ', '.join('?' * len(user_ids))
+            rows = self._connect().execute(
+                f'SELECT user_id, date, value FROM records WHERE collection = ? AND user_id IN ({placeholders}) '
+                'ORDER BY rowid', [collection] + user_ids)
+            nbytes = 0
+            for user_id, key, value in rows:
+                grouped[user_id].append((key, value))
+                nbytes += len(value)
+            self._count('read', collection, nbytes)
+        return {user_id: self._assemble(rows) if rows else {} for user_id, rows in grouped.items()}
+
+    @_timed('load')
+    def load_page(self, collection, user_id, limit, before=None, order_field=None):
+        collection = validate_collection(collection)
+        if order_field is not None:
+            order = "CAST(COALESCE(json_extract(value, '$.' || ?), '') AS TEXT)"
+            order_args = [order_field]
+        else:
+            order, order_args = "''", []
+        sql = (f'SELECT {order} AS ord, date, value FROM records '
+               "WHERE collection = ? AND user_id = ? AND date != ''")
+        args = order_args + [collection, user_id]
+        if before is not None:
+            sql += ' AND (ord, date) < (?, ?)'
+            args += list(before)
+        sql += ' ORDER BY ord DESC, date DESC LIMIT ?'
+        rows = self._connect().execute(sql, args + [limit]).fetchall()
+        self._count('read', collection, sum(len(row[2]) for row in rows))
+        return [((ord_value, key), jsoncodec.loads(value)) for ord_value, key, value in rows]
+
+    @_timed('load')
+    def load_record(self, collection, user_id, key):
+        collection = validate_collection(collection)
+        row = self._connect().execute(
+            'SELECT value FROM records WHERE collection = ? AND user_id = ? AND date = ?',
+            (collection, user_id, key)).fetchone()
+        if row is not None:
+            self._count('read', collection, len(row[0]))
+            return jsoncodec.loads(row[0])
+        # Fall back to a user stored as a single whole-value row
+        user_data = self._load_user(collection, user_id)
+        return user_data.get(key, {}) if isinstance(user_data, dict) else {}
+
+    @_timed('save')
+    def save_user(self, collection, user_id, data):
+        collection = validate_collection(collection)
+        with self._transaction() as conn:
+            self._write_user(conn, collection, user_id, data)
+
+    def put(self, collection, key, value):
+        self.save_user(collection, key, value)
+
+    def user_version(self, collection, user_id):
+        collection = validate_collection(collection)
+        row = self._connect().execute(
+            'SELECT version FROM versions WHERE collection = ? AND user_id = ?', (collection, user_id)).fetchone()
+        return row[0] if row else 0
+
+    def collection_version(self, collection):
+        # Versions only ever grow, so their sum moves on any write to the collection
+        collection = validate_collection(collection)
+        row = self._connect().execute(
+            'SELECT COALESCE(SUM(version), 0) FROM versions WHERE collection = ?', (collection,)).fetchone()
+        return row[0]
+
+    @_timed('save')
+    def put_record(self, collection, user_id, key, record):
+        collection = validate_collection(collection)
+        with self._transaction() as conn:
+            # A whole-value row can't coexist with per-record rows, so fold it in
+            whole = conn.execute('SELECT value FROM records WHERE collection = ? AND user_id = ? AND date = ?',
+                                 (collection, user_id, '')).fetchone()
+            if whole is not None:
+                data = jsoncodec.loads(whole[0])
+                data = data if isinstance(data, dict) else {}
+                data[key] = record
+                self._write_user(conn, collection, user_id, data)
+                return
+            self._bump(conn, collection, user_id)
+            value = jsoncodec.dumps(record)
+            self._count('written', collection, len(value))
+            conn.execute(
+                'INSERT INTO records (collection, user_id, date, value) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (collection, user_id, date) DO UPDATE SET value = excluded.value',
+                (collection, user_id, key, value))
+
+    @_timed('save')
+    def put_records(self, collection, user_id, records):
+        collection = validate_collection(collection)
+        if not records:
+            return
+        with self._transaction() as conn:
+            whole = conn.execute('SELECT value FROM records WHERE collection = ? AND user_id = ? AND date = ?',
+                                 (collection, user_id, '')).fetchone()
+            if whole is not None:
+                data = jsoncodec.loads(whole[0])
+                data = data if isinstance(data, dict) else {}
+                data.update(records)
+                self._write_user(conn, collection, user_id, data)
+                return
+            self._bump(conn, collection, user_id)
+            rows = [(collection, user_id, key, jsoncodec.dumps(record)) for key, record in records.items()]
+            self._count('written', collection, sum(len(row[3]) for row in rows))
+            conn.executemany(
+                'INSERT INTO records (collection, user_id, date, value) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (collection, user_id, date) DO UPDATE SET value = excluded.value', rows)
+
+    # User lookups go through the partial expression indexes in SCHEMA, which
+    # SQLite keeps up to date on every write to the users collection
+    def find_user_by_email(self, email):
+        row = self._connect().execute(
+            "SELECT value FROM records WHERE collection = 'users' "
+            "AND lower(json_extract(value, '$.email')) = ? ORDER BY rowid LIMIT 1", (email.lower(),)).fetchone()
+        return jsoncodec.loads(row[0]) if row else None
+
+    def find_child(self, name, pin):
+        row = self._connect().execute(
+            "SELECT value FROM records WHERE collection = 'users' "
+            "AND lower(json_extract(value, '$.name')) = ? AND json_extract(value, '$.pin') = ? "
+            "AND json_extract(value, '$.role') = 'child' ORDER BY rowid LIMIT 1", (name.lower(), pin)).fetchone()
+        return jsoncodec.loads(row[0]) if row else None
+
+    def family_members(self, family_id):
+        rows = self._connect().execute(
+            "SELECT value FROM records WHERE collection = 'users' "
+            "AND json_extract(value, '$.family_id') = ? ORDER BY rowid", (family_id,))
+        return [jsoncodec.loads(row[0]) for row in rows]
+
+    def recover(self):
+        # SQLite's own WAL handles crash recovery
+        return []
+
+    def cache_stats(self):
+        # Reads are already row-scoped, nothing is cached in process
+        return None
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def create_storage(backend, data_dir, db_path=None):
+    if backend == 'json':
+        return JSONStorage(data_dir)
+    if backend == 'sqlite':
+        return SQLiteStorage(db_path or os.path.join(data_dir, 'pams.db'))
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+def migrate(source, target):
+    # Copy every collection from one backend into another
+    migrated = {}
+    for collection in source.collections():
+        data = source.load(collection)
+        target.save(collection, data)
+        migrated[collection] = len(data)
+    return migrated
@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Tests that import app get throwaway data and in-process limits and hashing
+os.environ['PAMS_DATA_DIR'] = tempfile.mkdtemp(prefix='pams-test-')
+os.environ['PAMS_RATELIMIT_STORAGE'] = 'memory://'
+os.environ['PAMS_HASH_WORKERS'] = '0'
@@ -0,0 +1,26 @@
+import os
+
+from limiter_storage import SQLiteLimiterStorage, storage_uri
+
+
+def test_relative_uri_stays_relative(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    storage = SQLiteLimiterStorage('sqlite:///data/ratelimit.db')
+    assert storage.db_path == os.path.join('data', 'ratelimit.db')
+    storage.incr('key', 60)
+    assert (tmp_path / 'data' / 'ratelimit.db').exists()
+
+
+def test_absolute_uri(tmp_path):
+    path = tmp_path / 'limits' / 'ratelimit.db'
+    storage = SQLiteLimiterStorage('sqlite:///' + str(path))
+    assert storage.db_path == str(path)
+    storage.incr('key', 60)
+    assert path.exists()
+
+
+def test_default_uri_is_under_data_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    storage = SQLiteLimiterStorage(storage_uri('data'))
+    storage.incr('key', 60)
+    assert (tmp_path / 'data' / 'ratelimit.db').exists()
@@ -0,0 +1,95 @@
+import base64
+import random
+
+import pytest
+
+import app
+from storage import JSONStorage, SQLiteStorage, page_items
+
+
+@pytest.fixture(params=['json', 'sqlite'])
+def backend(request, tmp_path):
+    if request.param == 'json':
+        return JSONStorage(str(tmp_path / 'data'))
+    return SQLiteStorage(str(tmp_path / 'pams.db'))
+
+
+def posts(count=57):
+    # Shuffled keys and tied timestamps, so order depends on the tie-break too
+    rng = random.Random(7)
+    keys = [f'post{n:03d}' for n in range(count)]
+    rng.shuffle(keys)
+    return {key: {'timestamp': f'2024-01-{rng.randint(1, 9):02d}T10:00', 'n': n} for n, key in enumerate(keys)}
+
+
+def walk(storage, user_id, limit, order_field=None):
+    # Every page as the API would serve it, following next_cursor to the end
+    pages, before = [], None
+    while True:
+        rows, cursor = app.finish_page(storage.load_page('team_social', user_id, limit + 1, before, order_field),
+                                       limit)
+        pages.append([key for key, _ in rows])
+        if cursor is None:
+            return pages
+        before = app.decode_cursor(cursor)
+
+
+@pytest.mark.parametrize('order_field', [None, 'timestamp'])
+def test_pages_cover_everything_once_in_order(backend, order_field):
+    records = posts()
+    backend.put_records('team_social', 'u1', records)
+    pages = walk(backend, 'u1', 10, order_field)
+
+    assert [len(page) for page in pages] == [10, 10, 10, 10, 10, 7]
+    newest_first = [key for page in pages for key in reversed(page)]
+    expected = [key for (_, key), _ in page_items(records.items(), len(records), order_field=order_field)]
+    assert newest_first == expected
+
+
+@pytest.mark.parametrize('order_field', [None, 'timestamp'])
+def test_backends_agree(tmp_path, order_field):
+    records = posts()
+    json_storage = JSONStorage(str(tmp_path / 'data'))
+    sqlite_storage = SQLiteStorage(str(tmp_path / 'pams.db'))
+    for storage in (json_storage, sqlite_storage):
+        storage.put_records('team_social', 'u1', records)
+    assert walk(json_storage, 'u1', 8, order_field) == walk(sqlite_storage, 'u1', 8, order_field)
+
+
+@pytest.mark.parametrize('count, sizes', [(0, [0]), (1, [1]), (10, [10]), (11, [10, 1]), (20, [10, 10])])
+def test_last_page_boundary(backend, count, sizes):
+    backend.put_records('team_social', 'u1', posts(count))
+    assert [len(page) for page in walk(backend, 'u1', 10)] == sizes
+
+
+def test_cursor_round_trip():
+    sort_key = ('2024-01-01T10:00', 'post001')
+    assert app.decode_cursor(app.encode_cursor(sort_key)) == sort_key
+
+
+def encoded(value):
+    return base64.urlsafe_b64encode(value).decode().rstrip('=')
+
+
+@pytest.mark.parametrize('cursor', [
+    '!!!',
+    'abc',
+    encoded(b'not json'),
+    encoded(b'{"a": 1}'),
+    encoded(b'["only one"]'),
+    encoded(b'["a", 1]'),
+    encoded(b'["a", "b", "c"]'),
+])
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError, match='Invalid cursor'):
+        app.decode_cursor(cursor)
+
+
+def test_api_rejects_malformed_cursor():
+    client = app.app.test_client()
+    response = client.post('/register', json={'parent_name': 'Pat', 'email': 'page@x.com', 'password': 'secret1'})
+    assert response.status_code == 200
+    assert client.get('/api/checkins?cursor=%21%21%21').status_code == 400
+    response = client.get('/api/checkins?limit=500')
+    assert response.status_code == 200
+    assert response.json == {'checkins': [], 'next_cursor': None}
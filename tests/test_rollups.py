@@ -0,0 +1,81 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+import app
+from rollups import ROLLUP_WINDOWS, Rollup
+
+
+def assert_same_rollup(incremental, built):
+    assert incremental.recent == built.recent
+    for size in ROLLUP_WINDOWS:
+        got, want = incremental.window(size), built.window(size)
+        assert got['count'] == want['count']
+        for stat in ('sum', 'sumsq', 'min', 'max'):
+            assert got[stat].keys() == want[stat].keys()
+            for field, value in want[stat].items():
+                assert got[stat][field] == pytest.approx(value, abs=1e-6), (size, stat, field)
+
+
+def checkin(rng):
+    return {'sleep_hours': rng.choice([6, 7.5, 8, 9, 10]), 'mood': rng.randint(1, 5),
+            'water_bottles': rng.randint(0, 6), 'training_completed': rng.random() < 0.7,
+            'homework_done': rng.choice([True, False, None, 'yes'])}
+
+
+def day(n):
+    return str(date(2024, 1, 1) + timedelta(days=n))
+
+
+def test_apply_in_date_order_matches_build():
+    rng = random.Random(1)
+    records, rollup = {}, Rollup('checkins')
+    for n in range(45):
+        records[day(n)] = checkin(rng)
+        rollup.apply(day(n), records[day(n)])
+        assert_same_rollup(rollup, Rollup.build('checkins', records))
+
+
+def test_overwrites_and_out_of_order_writes_match_build():
+    rng = random.Random(2)
+    records, rollup = {}, Rollup('checkins')
+    for _ in range(300):
+        # Mostly recent days, some far outside the 30-record window
+        key = day(rng.randint(0, 60) if rng.random() < 0.8 else rng.randint(-200, -100))
+        records[key] = checkin(rng)
+        rollup.apply(key, records[key])
+        assert_same_rollup(rollup, Rollup.build('checkins', records))
+
+
+def test_write_older_than_every_window_changes_nothing():
+    rng = random.Random(3)
+    records = {day(n): checkin(rng) for n in range(40)}
+    rollup = Rollup.build('checkins', records)
+    before = rollup.to_dict()
+    rollup.apply(day(-1), checkin(rng))
+    assert rollup.to_dict() == before
+
+
+def test_round_trips_through_storage_state():
+    rng = random.Random(4)
+    records = {day(n): {'steps': rng.randint(0, 20000), 'active_minutes': rng.randint(0, 120),
+                        'calories': rng.randint(1500, 3500)} for n in range(20)}
+    built = Rollup.build('activity_imports', records)
+    assert_same_rollup(Rollup('activity_imports', built.to_dict()), built)
+
+
+def test_app_single_and_bulk_writes_keep_rollup_in_step():
+    rng = random.Random(5)
+    user_id = 'rollup-test-user'
+    for n in range(35):
+        app.save_user_record('checkins', day(n), checkin(rng), user_id=user_id)
+    app.save_user_record('checkins', day(3), checkin(rng), user_id=user_id)  # outside the windows
+    app.save_user_record('checkins', day(30), checkin(rng), user_id=user_id)  # overwrite inside them
+
+    records = app.storage.load_user('checkins', user_id)
+    assert_same_rollup(app.get_user_rollup('checkins', user_id), Rollup.build('checkins', records))
+
+    app.save_user_records('checkins', {day(n): checkin(rng) for n in range(20, 50)}, user_id=user_id)
+    records = app.storage.load_user('checkins', user_id)
+    assert_same_rollup(app.get_user_rollup('checkins', user_id), Rollup.build('checkins', records))
@@ -0,0 +1,177 @@
+import os
+import threading
+
+import pytest
+
+from storage import SHARED_SHARD, JSONStorage, SQLiteStorage, migrate
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = JSONStorage(str(tmp_path / 'data'))
+    storage.put('users', 'p1', {'id': 'p1', 'role': 'parent', 'family_id': 'fam1', 'email': 'p@x.com'})
+    storage.put('users', 'c1', {'id': 'c1', 'role': 'child', 'family_id': 'fam1', 'name': 'Kid', 'pin': '1234'})
+    storage.put('users', 'p2', {'id': 'p2', 'role': 'parent', 'family_id': 'fam2', 'email': 'q@x.com'})
+    return storage
+
+
+def test_users_stay_in_one_file(storage):
+    assert not storage.is_sharded('users')
+    assert os.path.exists(storage.journal_path('users'))
+    assert storage.find_user_by_email('P@X.com')['id'] == 'p1'
+    assert storage.find_child('kid', '1234')['id'] == 'c1'
+
+
+def test_records_are_sharded_by_family(storage):
+    storage.put_record('checkins', 'p1', '2024-01-01', {'mood': 3})
+    storage.put_record('checkins', 'c1', '2024-01-01', {'mood': 4})
+    storage.put_record('checkins', 'p2', '2024-01-01', {'mood': 5})
+
+    assert storage.shard_for('c1') == 'fam1'
+    assert storage.shards('checkins') == ['fam1', 'fam2']
+    assert storage.load_user('checkins', 'c1') == {'2024-01-01': {'mood': 4}}
+    assert storage.load('checkins') == {
+        'p1': {'2024-01-01': {'mood': 3}},
+        'c1': {'2024-01-01': {'mood': 4}},
+        'p2': {'2024-01-01': {'mood': 5}},
+    }
+
+
+def test_family_and_unknown_keys_route_to_their_shards(storage):
+    storage.put_record('competitions', 'fam1', 'e1', {'date': '2024-05-01'})
+    storage.put('goals', 'g1', {'title': 'x'})
+
+    assert storage.shard_for('fam1') == 'fam1'
+    assert storage.shard_for('g1') == SHARED_SHARD
+    assert storage.shards('goals') == [SHARED_SHARD]
+    assert storage.load('goals') == {'g1': {'title': 'x'}}
+
+
+def test_loads_are_copies(storage):
+    storage.put_record('checkins', 'p1', '2024-01-01', {'mood': 3})
+    storage.load_user('checkins', 'p1')['2024-01-01']['mood'] = 99
+    assert storage.load_record('checkins', 'p1', '2024-01-01') == {'mood': 3}
+
+
+def test_journal_replay_and_compaction(storage):
+    storage.put_record('checkins', 'p1', '2024-01-01', {'mood': 3})
+    storage.put_record('checkins', 'p1', '2024-01-02', {'mood': 4})
+    journal = storage.journal_path('checkins', 'fam1')
+    assert os.path.exists(journal)
+
+    # A second process sees the journal through its own cache
+    other = JSONStorage(storage.data_dir)
+    assert len(other.load_user('checkins', 'p1')) == 2
+
+    assert storage.compact('checkins', shard='fam1')
+    assert not os.path.exists(journal)
+    assert len(other.load_user('checkins', 'p1')) == 2
+    assert not storage.compact('checkins', shard='fam1')
+
+
+def test_torn_journal_line_is_skipped(storage):
+    storage.put_record('checkins', 'p1', '2024-01-01', {'mood': 3})
+    with open(storage.journal_path('checkins', 'fam1'), 'ab') as f:
+        f.write(b'{"u": "p1", "k": "2024-01-02", "v": {"mo')
+    storage.put_record('checkins', 'p1', '2024-01-03', {'mood': 5})
+
+    assert sorted(JSONStorage(storage.data_dir).load_user('checkins', 'p1')) == ['2024-01-01', '2024-01-03']
+
+
+def test_recover_folds_leftover_journals(storage):
+    storage.put_record('checkins', 'p1', '2024-01-01', {'mood': 3})
+    storage.put('goals', 'g1', {'title': 'x'})
+
+    restarted = JSONStorage(storage.data_dir)
+    assert sorted(restarted.recover()) == ['checkins/fam1', 'goals/' + SHARED_SHARD, 'users']
+    assert restarted.recover() == []
+    assert restarted.load_user('checkins', 'p1') == {'2024-01-01': {'mood': 3}}
+
+
+def test_corrupt_snapshot_is_never_overwritten(storage):
+    storage.put_record('checkins', 'p1', '2024-01-01', {'mood': 3})
+    storage.compact('checkins', shard='fam1')
+    path = storage.path('checkins', shard='fam1')
+    with open(path, 'w') as f:
+        f.write('{"p1": {"2024-01-0')
+    storage.put_record('checkins', 'p1', '2024-01-02', {'mood': 4})
+
+    restarted = JSONStorage(storage.data_dir)
+    with pytest.raises(ValueError):
+        restarted.load_user('checkins', 'p1')
+    assert 'checkins/fam1' not in restarted.recover()
+    with pytest.raises(ValueError):
+        restarted.compact('checkins', shard='fam1')
+    with open(path) as f:
+        assert f.read() == '{"p1": {"2024-01-0'
+    assert os.path.exists(storage.journal_path('checkins', 'fam1'))
+
+
+def test_reshard_splits_a_legacy_file(tmp_path):
+    data_dir = tmp_path / 'data'
+    legacy = JSONStorage(str(data_dir))
+    legacy.save('users', {'p1': {'id': 'p1', 'family_id': 'fam1'}, 'p2': {'id': 'p2'}})
+    with open(legacy.path('checkins'), 'w') as f:
+        f.write('{"p1": {"2024-01-01": {"mood": 3}}, "p2": {"2024-01-01": {"mood": 4}}, "x": {}}')
+
+    assert not legacy.is_sharded('checkins')
+    assert legacy.load_user('checkins', 'p1') == {'2024-01-01': {'mood': 3}}
+    before = legacy.load('checkins')
+
+    assert legacy.reshard() == {'checkins': (3, 3)}
+    assert legacy.is_sharded('checkins')
+    assert not os.path.exists(legacy.path('checkins'))
+    assert legacy.shards('checkins') == [SHARED_SHARD, 'fam1', 'p2']
+    assert legacy.load('checkins') == before
+    assert legacy.reshard() == {'checkins': (3, 3)}
+
+
+def test_reshard_skips_session_files(storage):
+    sessions = os.path.join(storage.data_dir, 'sessions')
+    os.makedirs(sessions)
+    with open(os.path.join(sessions, 'abc.json'), 'w') as f:
+        f.write('{}')
+    storage.put_record('checkins', 'p1', '2024-01-01', {'mood': 3})
+
+    assert 'sessions' not in storage.collections()
+    storage.reshard()
+    assert os.listdir(sessions) == ['abc.json']
+
+
+def test_migrate_round_trip(storage, tmp_path):
+    storage.put_record('checkins', 'p1', '2024-01-01', {'mood': 3})
+    storage.put_record('checkins', 'p2', '2024-01-02', {'mood': 4})
+    storage.put('goals', 'g1', {'title': 'x'})
+
+    sqlite = SQLiteStorage(str(tmp_path / 'pams.db'))
+    assert migrate(storage, sqlite) == {'checkins': 2, 'goals': 1, 'users': 3}
+    back = JSONStorage(str(tmp_path / 'back'))
+    migrate(sqlite, back)
+    for collection in ('users', 'checkins', 'goals'):
+        assert back.load(collection) == storage.load(collection)
+
+
+def test_collection_lock_is_reentrant(storage):
+    with storage.lock('checkins'):
+        with storage.lock('checkins'):
+            storage.put_record('checkins', 'p1', '2024-01-01', {'mood': 3})
+    with storage.lock('rollups', 'p1'):
+        with storage.lock('rollups', 'c1'):  # same family shard
+            storage.put_record('rollups', 'p1', 'checkins', {'n': 1})
+    assert storage.load_record('rollups', 'p1', 'checkins') == {'n': 1}
+
+
+def test_lock_excludes_other_threads(storage):
+    order = []
+
+    def other():
+        with storage.lock('goals'):
+            order.append('other')
+
+    with storage.lock('goals'):
+        thread = threading.Thread(target=other)
+        thread.start()
+        thread.join(0.2)
+        order.append('holder')
+    thread.join(5)
+    assert order == ['holder', 'other']
@@ -0,0 +1,122 @@
+import io
+from datetime import date
+
+import pytest
+from flask import Flask, g, jsonify
+from werkzeug.test import EnvironBuilder
+
+from validation import Field, Schema, validate_json
+
+SCHEMA = Schema({
+    'age': Field(int, required=True, low=3, high=25),
+    'sleep_hours': Field(float, low=0, high=24),
+    'done': Field(bool, default=False),
+    'name': Field(str, max_length=10),
+    'level': Field(str, choices=('low', 'high')),
+    'day': Field(date),
+    'tags': Field(list, max_length=2),
+}, max_bytes=200)
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+
+    @app.route('/echo', methods=['GET', 'POST'])
+    @validate_json(SCHEMA)
+    def echo():
+        return jsonify(g.get('data', {}))
+
+    return app.test_client()
+
+
+def test_values_are_coerced():
+    clean, errors = SCHEMA.validate({'age': '12', 'sleep_hours': '8.5', 'done': 'yes', 'name': 42,
+                                     'day': ' 2024-03-01 ', 'tags': ['a', 'b'], 'extra': 1})
+    assert errors == {}
+    assert clean == {'age': 12, 'sleep_hours': 8.5, 'done': True, 'name': '42',
+                     'day': '2024-03-01', 'tags': ['a', 'b']}
+
+
+def test_defaults_and_blank_optionals():
+    clean, errors = SCHEMA.validate({'age': 5, 'name': ''})
+    assert errors == {}
+    assert clean == {'age': 5, 'done': False}
+
+
+@pytest.mark.parametrize('data, field, message', [
+    ({}, 'age', 'Missing age'),
+    ({'age': 2}, 'age', 'age must be between 3 and 25'),
+    ({'age': 26}, 'age', 'age must be between 3 and 25'),
+    ({'age': 7.5}, 'age', 'age must be a whole number'),
+    ({'age': True}, 'age', 'Invalid age'),
+    ({'age': 5, 'sleep_hours': 'nan'}, 'sleep_hours', 'Invalid sleep_hours'),
+    ({'age': 5, 'sleep_hours': 25}, 'sleep_hours', 'sleep_hours must be between 0 and 24'),
+    ({'age': 5, 'done': 'maybe'}, 'done', 'Invalid done'),
+    ({'age': 5, 'name': 'x' * 11}, 'name', 'name is too long (max 10)'),
+    ({'age': 5, 'name': {'a': 1}}, 'name', 'Invalid name'),
+    ({'age': 5, 'level': 'mid'}, 'level', 'level must be one of: low, high'),
+    ({'age': 5, 'day': '2024-02-30'}, 'day', 'Invalid day'),
+    ({'age': 5, 'tags': ['a', 'b', 'c']}, 'tags', 'Too many tags (max 2)'),
+])
+def test_invalid_values(data, field, message):
+    clean, errors = SCHEMA.validate(data)
+    assert errors == {field: message}
+    assert field not in clean
+
+
+def test_markup_is_stripped():
+    clean, _ = SCHEMA.validate({'age': 5, 'name': '<b>Al</b>'})
+    assert clean['name'] == 'Al'
+
+
+def test_valid_body_reaches_the_view(client):
+    response = client.post('/echo', json={'age': '9', 'done': 1})
+    assert response.status_code == 200
+    assert response.json == {'age': 9, 'done': True}
+
+
+def test_errors_are_keyed_by_field(client):
+    response = client.post('/echo', json={'age': 1, 'level': 'mid'})
+    assert response.status_code == 400
+    assert response.json['fields'] == {'age': 'age must be between 3 and 25',
+                                       'level': 'level must be one of: low, high'}
+    assert response.json['error'] == 'age must be between 3 and 25'
+
+
+@pytest.mark.parametrize('kwargs', [
+    {'data': 'not json', 'content_type': 'application/json'},
+    {'json': [1, 2]},
+    {'data': '{"age": 5}', 'content_type': 'text/plain'},
+])
+def test_malformed_bodies(client, kwargs):
+    response = client.post('/echo', **kwargs)
+    assert response.status_code == 400
+    assert response.json == {'error': 'Invalid JSON'}
+
+
+def test_oversized_body_with_content_length(client):
+    response = client.post('/echo', json={'age': 5, 'name': 'x' * 300})
+    assert response.status_code == 413
+
+
+def test_oversized_chunked_body(client):
+    # No Content-Length: the limit is enforced while reading the stream
+    body = b'{"age": 5, "name": "' + b'x' * 300 + b'"}'
+    builder = EnvironBuilder(path='/echo', method='POST', input_stream=io.BytesIO(body),
+                             content_type='application/json')
+    environ = builder.get_environ()
+    del environ['CONTENT_LENGTH']
+    environ['wsgi.input_terminated'] = True
+    response = client.open(environ)
+    assert response.status_code == 413
+
+    environ = EnvironBuilder(path='/echo', method='POST', input_stream=io.BytesIO(b'{"age": 5}'),
+                             content_type='application/json').get_environ()
+    del environ['CONTENT_LENGTH']
+    environ['wsgi.input_terminated'] = True
+    assert client.open(environ).json == {'age': 5, 'done': False}
+
+
+def test_other_methods_are_not_validated(client):
+    assert client.get('/echo').json == {}
@@ -0,0 +1,93 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import date, timedelta
+import threading
+
+# Numeric fields tracked per collection; booleans are stored as 0/1
+SERIES_FIELDS = {
+    'checkins': ('sleep_hours', 'mood', 'water_bottles', 'training_completed', 'homework_done'),
+    'activity_imports': ('steps', 'active_minutes', 'calories', 'distance', 'heart_rate_avg'),
+}
+
+MISSING = float('nan')
+
+
+def _to_float(value):
+    if isinstance(value, bool):
+        return 1.0 if value else 0.0
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return MISSING
+
+
+def _is_date_key(key):
+    try:
+        date.fromisoformat(key)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+# A contiguous, date-ordered slice of a TimeSeries
+class Window:
+    def __init__(self, dates, columns):
+        self.dates = dates
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.dates)
+
+
+# One user's date-keyed records as sorted dates plus one float array per field
+class TimeSeries:
+    def __init__(self, records, fields):
+        self.dates = sorted(k for k, v in records.items() if isinstance(v, dict) and _is_date_key(k))
+        self.columns = {
+            field: array('d', (_to_float(records[d].get(field)) for d in self.dates))
+            for field in fields
+        }
+
+    def __len__(self):
+        return len(self.dates)
+
+    def _window(self, lo, hi):
+        return Window(self.dates[lo:hi], {f: col[lo:hi] for f, col in self.columns.items()})
+
+    def last(self, n):
+        # The n most recent records by date
+        return self._window(max(len(self.dates) - n, 0), len(self.dates))
+
+    def between(self, start, end):
+        # Inclusive ISO date range
+        return self._window(bisect_left(self.dates, str(start)), bisect_right(self.dates, str(end)))
+
+    def last_days(self, days, today=None):
+        end = today or date.today()
+        return self.between(end - timedelta(days=days - 1), end)
+
+
+# Built series per (collection, user), rebuilt when the storage version moves
+class SeriesCache:
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, storage, collection, user_id):
+        key = (collection, user_id)
+        version = storage.user_version(collection, user_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        series = TimeSeries(storage.load_user(collection, user_id), SERIES_FIELDS[collection])
+        with self._lock:
+            self._entries[key] = (version, series)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return series
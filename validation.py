@@ -0,0 +1,189 @@
+from datetime import date
+from functools import wraps
+import math
+import re
+import threading
+
+import bleach
+from flask import g, jsonify, request
+
+import jsoncodec
+
+# Characters bleach.clean(tags=[], strip=True) would rewrite: markup plus the
+# control characters it replaces. Strings without any come back unchanged.
+NEEDS_CLEANING = re.compile(r'[\x00-\x08\x0b-\x1f&<>]')
+_cleaners = threading.local()
+
+TRUE_STRINGS = ('true', '1', 'yes', 'on')
+FALSE_STRINGS = ('false', '0', 'no', 'off')
+
+
+def clean_text(value):
+    if not NEEDS_CLEANING.search(value):
+        return value
+    # A Cleaner holds parser state, so each thread reuses its own
+    cleaner = getattr(_cleaners, 'cleaner', None)
+    if cleaner is None:
+        cleaner = _cleaners.cleaner = bleach.Cleaner(tags=[], strip=True)
+    return cleaner.clean(value)
+
+
+def _to_number(value, name):
+    if isinstance(value, bool):
+        raise ValueError(f'Invalid {name}')
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid {name}')
+    if math.isnan(value) or math.isinf(value):
+        raise ValueError(f'Invalid {name}')
+    return value
+
+
+def _to_bool(value, name):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.strip().lower() in TRUE_STRINGS + FALSE_STRINGS:
+        return value.strip().lower() in TRUE_STRINGS
+    raise ValueError(f'Invalid {name}')
+
+
+def _to_text(value, name):
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise ValueError(f'Invalid {name}')
+    return clean_text(str(value))
+
+
+def _to_date(value, name):
+    try:
+        return str(date.fromisoformat(str(value).strip()))
+    except ValueError:
+        raise ValueError(f'Invalid {name}')
+
+
+# One field of a request body. kind is int, float, bool, str, date or list
+# (a list of strings); a missing optional field with no default is left out.
+class Field:
+    def __init__(self, kind, required=False, default=None, low=None, high=None, max_length=None, choices=None):
+        self.kind = kind
+        self.required = required
+        self.default = default
+        self.low = low
+        self.high = high
+        self.max_length = max_length
+        self.choices = choices
+
+    def compile(self, name):
+        # Build the converter once, so validating a body is a flat list of calls
+        kind, low, high, max_length, choices = self.kind, self.low, self.high, self.max_length, self.choices
+
+        def check_range(value):
+            if (low is not None and value < low) or (high is not None and value > high):
+                raise ValueError(f'{name} must be between {low} and {high}')
+            return value
+
+        def check_text(value):
+            if max_length is not None and len(value) > max_length:
+                raise ValueError(f'{name} is too long (max {max_length})')
+            if choices is not None and value not in choices:
+                raise ValueError(f'{name} must be one of: {", ".join(choices)}')
+            return value
+
+        if kind is int:
+            def convert_int(value):
+                number = _to_number(value, name)
+                if number != int(number):
+                    raise ValueError(f'{name} must be a whole number')
+                return check_range(int(number))
+            return convert_int
+        if kind is float:
+            return lambda value: check_range(_to_number(value, name))
+        if kind is bool:
+            return lambda value: _to_bool(value, name)
+        if kind is str:
+            return lambda value: check_text(_to_text(value, name))
+        if kind is date:
+            return lambda value: check_range(_to_date(value, name))
+        if kind is list:
+            def convert_list(value):
+                if not isinstance(value, list):
+                    raise ValueError(f'Invalid {name}')
+                if max_length is not None and len(value) > max_length:
+                    raise ValueError(f'Too many {name} (max {max_length})')
+                items = [_to_text(item, name) for item in value]
+                if choices is not None and any(item not in choices for item in items):
+                    raise ValueError(f'{name} must be one of: {", ".join(choices)}')
+                return items
+            return convert_list
+        raise ValueError(f'Unsupported field type for {name}: {kind}')
+
+
+class Schema:
+    def __init__(self, fields, max_bytes=16 * 1024):
+        self.fields = fields
+        self.max_bytes = max_bytes
+        self._steps = [(name, field.required, field.default, field.compile(name))
+                       for name, field in fields.items()]
+
+    def validate(self, data):
+        # Returns (clean, errors); keys not in the schema are dropped
+        clean = {}
+        errors = {}
+        for name, required, default, convert in self._steps:
+            value = data.get(name)
+            if value is None or value == '':
+                if required:
+                    errors[name] = f'Missing {name}'
+                elif default is not None:
+                    clean[name] = list(default) if isinstance(default, list) else default
+                continue
+            try:
+                clean[name] = convert(value)
+            except ValueError as e:
+                errors[name] = str(e)
+        return clean, errors
+
+
+def _read_at_most(stream, limit):
+    # Streams may return short reads, so keep reading until limit or EOF
+    chunks = []
+    remaining = limit
+    while remaining > 0:
+        chunk = stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+def validate_json(schema, methods=('POST',)):
+    # Parses, validates and coerces the JSON body in one pass for the given
+    # methods and exposes the result as g.data. Reads at most max_bytes + 1
+    # bytes, so oversized bodies are refused without being buffered.
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method in methods:
+                if request.content_length and request.content_length > schema.max_bytes:
+                    return jsonify({'error': 'Payload too large'}), 413
+                if not request.is_json:
+                    return jsonify({'error': 'Invalid JSON'}), 400
+                body = _read_at_most(request.stream, schema.max_bytes + 1)
+                if len(body) > schema.max_bytes:
+                    return jsonify({'error': 'Payload too large'}), 413
+                try:
+                    data = jsoncodec.loads(body)
+                except ValueError:
+                    return jsonify({'error': 'Invalid JSON'}), 400
+                if not isinstance(data, dict):
+                    return jsonify({'error': 'Invalid JSON'}), 400
+
+                g.data, errors = schema.validate(data)
+                if errors:
+                    return jsonify({'error': next(iter(errors.values())), 'fields': errors}), 400
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator